@@ -2,6 +2,9 @@ import os
 from flask import Flask
 from app.extensions import mail, login_manager
 from app.database import close_db
+from app import db_instrumentation
+from app.view_counter import view_counter
+from app.outbox import outbox_worker
 from config import Config
 from app.context_processors import cart_context, utility_context
 
@@ -21,6 +24,9 @@ def create_app(config_class=Config):
 
     # database
     app.teardown_appcontext(close_db)
+    db_instrumentation.init_app(app)
+    view_counter.init_app(app)
+    outbox_worker.init_app(app)
 
     # Контекстные процессоры
     app.context_processor(cart_context)
@@ -373,11 +373,98 @@
 import csv
 import json
 import os
+import shutil
+import tempfile
+import uuid
 import zipfile
 from datetime import datetime
-from io import BytesIO, StringIO
-
-from app.database import get_cursor
+from io import StringIO
+
+from flask import current_app
+from psycopg2 import sql
+from psycopg2.extensions import encodings
+
+from app.database import get_db_connection
+
+# Таблицы, которые можно выгрузить целиком
+TABLE_EXPORTS = {
+    'categories': 'categories',
+    'brands': 'shop_brand',
+}
+
+BACKUP_TABLES = [
+    'users', 'products', 'categories', 'shop_brand',
+    'orders', 'order_items', 'reviews', 'cart_items',
+    'wishlists', 'product_images', 'product_sizes',
+    'product_attributes', 'product_price_history'
+]
+
+COPY_OPTIONS = "(FORMAT csv, HEADER, ENCODING 'UTF8')"
+
+# Отчёты с русскими заголовками: форматирование выполняется в SQL,
+# поэтому запрос годится и для COPY, и для построчной выгрузки
+USERS_EXPORT_SQL = """
+    SELECT
+        u.id AS "ID",
+        u.username AS "Имя пользователя",
+        u.email AS "Email",
+        u.first_name AS "Имя",
+        u.last_name AS "Фамилия",
+        u.phone AS "Телефон",
+        u.address AS "Адрес",
+        to_char(u.created_at, 'DD.MM.YYYY HH24:MI') AS "Дата регистрации",
+        CASE WHEN u.is_admin THEN 'Да' ELSE 'Нет' END AS "Администратор",
+        COALESCE(COUNT(o.id), 0) AS "Количество заказов",
+        COALESCE(SUM(o.total_amount), 0) AS "Общая сумма покупок"
+    FROM users u
+    LEFT JOIN orders o ON u.id = o.user_id
+    GROUP BY u.id
+    ORDER BY u.created_at DESC
+"""
+
+PRODUCTS_EXPORT_SQL = """
+    SELECT
+        p.id AS "ID",
+        p.name AS "Название",
+        p.description AS "Описание",
+        p.price AS "Цена",
+        p.sku AS "Артикул",
+        p.stock AS "Количество",
+        CASE WHEN p.is_published THEN 'Да' ELSE 'Нет' END AS "Опубликован",
+        to_char(p.created_at, 'DD.MM.YYYY HH24:MI') AS "Дата создания",
+        c.name AS "Категория",
+        b.name AS "Бренд",
+        STRING_AGG(DISTINCT ps.size, ', ') AS "Размеры",
+        STRING_AGG(DISTINCT pa.value, ' | ') AS "Атрибуты"
+    FROM products p
+    LEFT JOIN categories c ON p.category_id = c.id
+    LEFT JOIN shop_brand b ON p.brand_id = b.id
+    LEFT JOIN product_sizes ps ON p.id = ps.product_id
+    LEFT JOIN product_attributes pa ON p.id = pa.product_id
+    GROUP BY p.id, c.name, b.name
+    ORDER BY p.created_at DESC
+"""
+
+ORDERS_EXPORT_SQL = """
+    SELECT
+        o.id AS "ID",
+        o.order_number AS "Номер заказа",
+        o.total_amount AS "Сумма",
+        o.status AS "Статус",
+        to_char(o.created_at, 'DD.MM.YYYY HH24:MI') AS "Дата создания",
+        o.shipping_address AS "Адрес доставки",
+        o.payment_method AS "Способ оплаты",
+        u.username AS "Пользователь",
+        u.email AS "Email",
+        COUNT(oi.id) AS "Количество товаров"
+    FROM orders o
+    LEFT JOIN users u ON o.user_id = u.id
+    LEFT JOIN order_items oi ON o.id = oi.order_id
+    WHERE (%(start_date)s::timestamp IS NULL OR o.created_at >= %(start_date)s::timestamp)
+      AND (%(end_date)s::timestamp IS NULL OR o.created_at <= %(end_date)s::timestamp)
+    GROUP BY o.id, u.username, u.email
+    ORDER BY o.created_at DESC
+"""
 
 
 class ExportService:
@@ -392,33 +479,128 @@ class ExportService:
         
         print(f"ExportService: Директория экспорта: {self.export_dir}")  # Debug
 
+    def iter_csv(self, query, params=None, itersize=None):
+        """CSV по частям (байты UTF-8) для отдачи в HTTP-ответ.
+
+        Строки читаются серверным (именованным) курсором порциями по
+        itersize (EXPORT_ITERSIZE), и каждая порция сразу кодируется и
+        отдаётся, поэтому память не зависит от размера таблицы.
+        query может быть функцией (cur) -> SQL, если запрос строится по схеме.
+        """
+        itersize = itersize or current_app.config.get('EXPORT_ITERSIZE', 2000)
+        conn = get_db_connection()
+        try:
+            if callable(query):
+                with conn.cursor() as cur:
+                    query = query(cur)
+
+            with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cur:
+                cur.itersize = itersize
+                cur.execute(query, params)
+
+                buffer = StringIO()
+                writer = csv.writer(buffer)
+
+                rows = cur.fetchmany(itersize)
+                writer.writerow([column.name for column in cur.description])
+
+                while rows:
+                    writer.writerows(rows)
+                    yield buffer.getvalue().encode('utf-8')
+                    buffer.seek(0)
+                    buffer.truncate()
+                    rows = cur.fetchmany(itersize)
+
+                if buffer.tell():
+                    yield buffer.getvalue().encode('utf-8')
+        finally:
+            conn.rollback()
+            conn.close()
+
+    def _copy_query(self, cur, query, params=None):
+        """COPY (SELECT ...) TO STDOUT - CSV с заголовком формирует сам PostgreSQL"""
+        if params is not None:
+            query = cur.mogrify(query, params).decode(encodings[cur.connection.encoding])
+        return f"COPY ({query}) TO STDOUT WITH {COPY_OPTIONS}"
+
+    def _table_select(self, cur, table_name):
+        """SELECT всех колонок таблицы в том виде, в каком их понимает импорт.
+
+        Генерируемые колонки (search_vector) пропускаются, логические
+        значения выводятся как True/False, а не t/f, как в COPY по умолчанию.
+        """
+        cur.execute("""
+            SELECT column_name, data_type
+            FROM information_schema.columns
+            WHERE table_schema = current_schema()
+              AND table_name = %s
+              AND is_generated = 'NEVER'
+            ORDER BY ordinal_position
+        """, (table_name,))
+
+        columns = []
+        for name, data_type in cur.fetchall():
+            column = sql.Identifier(name)
+            if data_type == 'boolean':
+                columns.append(sql.SQL(
+                    "CASE WHEN {0} THEN 'True' WHEN NOT {0} THEN 'False' END AS {0}"
+                ).format(column))
+            else:
+                columns.append(column)
+
+        statement = sql.SQL("SELECT {} FROM {}").format(
+            sql.SQL(', ').join(columns), sql.Identifier(table_name)
+        )
+        return statement.as_string(cur.connection)
+
+    def _copy_table(self, cur, table_name):
+        """COPY таблицы целиком через тот же SELECT, что и потоковая выгрузка"""
+        return self._copy_query(cur, self._table_select(cur, table_name))
+
+    def _copy_to_file(self, filepath, build_copy):
+        """Выполнить COPY и записать поток сразу в файл, минуя Python-строки"""
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cur, open(filepath, 'wb') as csvfile:
+                cur.copy_expert(build_copy(cur), csvfile)
+        finally:
+            conn.rollback()
+            conn.close()
+
+    def _default_filename(self, prefix):
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        return f"{prefix}_{timestamp}.csv"
+
+    def _orders_params(self, start_date=None, end_date=None):
+        return {'start_date': start_date or None, 'end_date': end_date or None}
+
+    def stream_export(self, export_type, start_date=None, end_date=None):
+        """Имя файла и генератор CSV для отдачи прямо в HTTP-ответ.
+
+        Возвращает None для неизвестного типа (и для полного бэкапа - он в ZIP).
+        """
+        if export_type == 'users':
+            chunks = self.iter_csv(USERS_EXPORT_SQL)
+        elif export_type == 'products':
+            chunks = self.iter_csv(PRODUCTS_EXPORT_SQL)
+        elif export_type == 'orders':
+            chunks = self.iter_csv(ORDERS_EXPORT_SQL, self._orders_params(start_date, end_date))
+        elif export_type in TABLE_EXPORTS:
+            table_name = TABLE_EXPORTS[export_type]
+            chunks = self.iter_csv(lambda cur: self._table_select(cur, table_name))
+        else:
+            return None
+        return self._default_filename(export_type), chunks
+
     def export_table_to_csv(self, table_name, filename=None):
         """Экспорт данных конкретной таблицы в CSV."""
         if filename is None:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"{table_name}_{timestamp}.csv"
+            filename = self._default_filename(table_name)
 
         filepath = os.path.join(self.export_dir, filename)
 
         try:
-            cur = get_cursor()
-
-            cur.execute(f"SELECT * FROM {table_name}")
-            records = cur.fetchall()
-
-            cur.execute("""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name = %s 
-                ORDER BY ordinal_position
-            """, (table_name,))
-            columns = [row[0] for row in cur.fetchall()]
-
-            with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(columns)
-                for record in records:
-                    writer.writerow(record)
+            self._copy_to_file(filepath, lambda cur: self._copy_table(cur, table_name))
 
             return {
                 'success': True,
@@ -437,51 +619,14 @@ class ExportService:
     def export_users_to_csv(self, filename=None):
         """Экспорт пользователей с дополнительной информацией."""
         if filename is None:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"users_{timestamp}.csv"
+            filename = self._default_filename('users')
 
         filepath = os.path.join(self.export_dir, filename)
         
         print(f"Попытка создания файла: {filepath}")  # Debug
 
         try:
-            cur = get_cursor()
-
-            cur.execute("""
-                SELECT
-                    u.id, u.username, u.email,
-                    u.first_name, u.last_name, u.phone, u.address,
-                    u.created_at, u.is_admin,
-                    COALESCE(COUNT(o.id), 0) as order_count,
-                    COALESCE(SUM(o.total_amount), 0) as total_spent
-                FROM users u
-                LEFT JOIN orders o ON u.id = o.user_id
-                GROUP BY u.id
-                ORDER BY u.created_at DESC
-            """)
-
-            records = cur.fetchall()
-
-            columns = [
-                'ID', 'Имя пользователя', 'Email',
-                'Имя', 'Фамилия', 'Телефон', 'Адрес',
-                'Дата регистрации', 'Администратор',
-                'Количество заказов', 'Общая сумма покупок'
-            ]
-
-            with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(columns)
-
-                for record in records:
-                    formatted_record = list(record)
-
-                    if formatted_record[7]:
-                        formatted_record[7] = formatted_record[7].strftime(
-                            '%d.%m.%Y %H:%M'
-                        )
-                    formatted_record[8] = 'Да' if formatted_record[8] else 'Нет'
-                    writer.writerow(formatted_record)
+            self._copy_to_file(filepath, lambda cur: self._copy_query(cur, USERS_EXPORT_SQL))
 
             print(f"Файл успешно создан: {filepath}")  # Debug
 
@@ -502,51 +647,12 @@ class ExportService:
     def export_products_to_csv(self, filename=None):
         """Экспорт товаров с детальной информацией."""
         if filename is None:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"products_{timestamp}.csv"
+            filename = self._default_filename('products')
 
         filepath = os.path.join(self.export_dir, filename)
 
         try:
-            cur = get_cursor()
-
-            cur.execute("""
-                SELECT
-                    p.id, p.name, p.description, p.price, p.sku,
-                    p.stock, p.is_published, p.created_at,
-                    c.name as category_name,
-                    b.name as brand_name,
-                    STRING_AGG(DISTINCT ps.size, ', ') as sizes,
-                    STRING_AGG(DISTINCT pa.value, ' | ') as attributes
-                FROM products p
-                LEFT JOIN categories c ON p.category_id = c.id
-                LEFT JOIN shop_brand b ON p.brand_id = b.id
-                LEFT JOIN product_sizes ps ON p.id = ps.product_id
-                LEFT JOIN product_attributes pa ON p.id = pa.product_id
-                GROUP BY p.id, c.name, b.name
-                ORDER BY p.created_at DESC
-            """)
-
-            records = cur.fetchall()
-
-            columns = [
-                'ID', 'Название', 'Описание', 'Цена', 'Артикул',
-                'Количество', 'Опубликован', 'Дата создания',
-                'Категория', 'Бренд', 'Размеры', 'Атрибуты'
-            ]
-
-            with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(columns)
-
-                for record in records:
-                    formatted_record = list(record)
-                    if formatted_record[7]:
-                        formatted_record[7] = formatted_record[7].strftime(
-                            '%d.%m.%Y %H:%M'
-                        )
-                    formatted_record[6] = 'Да' if formatted_record[6] else 'Нет'
-                    writer.writerow(formatted_record)
+            self._copy_to_file(filepath, lambda cur: self._copy_query(cur, PRODUCTS_EXPORT_SQL))
 
             return {
                 'success': True,
@@ -564,61 +670,13 @@ class ExportService:
     def export_orders_to_csv(self, start_date=None, end_date=None, filename=None):
         """Экспорт заказов за период."""
         if filename is None:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"orders_{timestamp}.csv"
+            filename = self._default_filename('orders')
 
         filepath = os.path.join(self.export_dir, filename)
+        params = self._orders_params(start_date, end_date)
 
         try:
-            cur = get_cursor()
-
-            query = """
-                SELECT
-                    o.id, o.order_number, o.total_amount, o.status,
-                    o.created_at, o.shipping_address, o.payment_method,
-                    u.username, u.email,
-                    COUNT(oi.id) as items_count
-                FROM orders o
-                LEFT JOIN users u ON o.user_id = u.id
-                LEFT JOIN order_items oi ON o.id = oi.order_id
-            """
-
-            params = []
-            conditions = []
-
-            if start_date:
-                conditions.append("o.created_at >= %s")
-                params.append(start_date)
-
-            if end_date:
-                conditions.append("o.created_at <= %s")
-                params.append(end_date)
-
-            if conditions:
-                query += " WHERE " + " AND ".join(conditions)
-
-            query += " GROUP BY o.id, u.username, u.email ORDER BY o.created_at DESC"
-
-            cur.execute(query, params)
-            records = cur.fetchall()
-
-            columns = [
-                'ID', 'Номер заказа', 'Сумма', 'Статус',
-                'Дата создания', 'Адрес доставки', 'Способ оплаты',
-                'Пользователь', 'Email', 'Количество товаров'
-            ]
-
-            with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(columns)
-
-                for record in records:
-                    formatted_record = list(record)
-                    if formatted_record[4]:
-                        formatted_record[4] = formatted_record[4].strftime(
-                            '%d.%m.%Y %H:%M'
-                        )
-                    writer.writerow(formatted_record)
+            self._copy_to_file(filepath, lambda cur: self._copy_query(cur, ORDERS_EXPORT_SQL, params))
 
             return {
                 'success': True,
@@ -641,30 +699,40 @@ class ExportService:
 
         zip_path = os.path.join(self.export_dir, filename)
 
+        conn = get_db_connection()
         try:
-            tables = [
-                'users', 'products', 'categories', 'shop_brand',
-                'orders', 'order_items', 'reviews', 'cart_items',
-                'wishlists', 'product_images', 'product_sizes',
-                'product_attributes', 'product_price_history'
-            ]
-
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for table in tables:
+            exported = []
+
+            with conn.cursor() as cur, zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                # Все таблицы выгружаются из одного снимка базы
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+
+                for table in BACKUP_TABLES:
+                    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+                    if not cur.fetchone()[0]:
+                        print(f"Таблица {table} не найдена, пропущена")
+                        continue
+
+                    # Ошибка в одной таблице не должна прерывать весь бэкап:
+                    # откатываемся к точке сохранения и идём дальше. Таблица
+                    # сначала пишется во временный файл, чтобы в архив не
+                    # попала оборванная запись.
+                    cur.execute("SAVEPOINT backup_table")
                     try:
-                        result = self.export_table_to_csv(table, f"{table}.csv")
-                        if result['success']:
-                            zipf.write(
-                                result['filepath'],
-                                os.path.basename(result['filepath'])
-                            )
-                            os.remove(result['filepath'])
+                        with tempfile.TemporaryFile() as tmp:
+                            cur.copy_expert(self._copy_table(cur, table), tmp)
+                            tmp.seek(0)
+                            with zipf.open(f"{table}.csv", 'w', force_zip64=True) as entry:
+                                shutil.copyfileobj(tmp, entry)
+                        cur.execute("RELEASE SAVEPOINT backup_table")
+                        exported.append(table)
                     except Exception as e:
+                        cur.execute("ROLLBACK TO SAVEPOINT backup_table")
                         print(f"Ошибка при экспорте таблицы {table}: {e}")
 
                 meta = {
                     'export_date': datetime.now().isoformat(),
-                    'tables_exported': tables,
+                    'tables_exported': exported,
                     'database': 'shoe_shop'  # Убрал зависимость от current_app
                 }
 
@@ -684,6 +752,10 @@ class ExportService:
                 'message': f'Ошибка при создании бэкапа: {str(e)}'
             }
 
+        finally:
+            conn.rollback()
+            conn.close()
+
     def get_available_exports(self):
         """Получить список доступных экспортов."""
         return [
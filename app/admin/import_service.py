@@ -3,7 +3,9 @@ import logging
 import os
 import re
 
+from app.autocomplete import suggest_index
 from app.database import get_cursor
+from app.reference_cache import reference_cache
 
 logger = logging.getLogger(__name__)
 
@@ -64,7 +66,7 @@ class ImportService:
                         phone = row.get('phone', '').strip()
                         address = row.get('address', '').strip()
                         is_admin_value = row.get('is_admin', 'False').strip().lower()
-                        is_admin = is_admin_value in ['true', '1', 'yes', 'да']
+                        is_admin = is_admin_value in ['true', 't', '1', 'yes', 'да']
 
                         if not username or not email:
                             stats['skipped'] += 1
@@ -143,12 +145,7 @@ class ImportService:
 
         try:
             cur = get_cursor()
-
-            cur.execute("SELECT id, name FROM categories")
-            categories = {row['name'].lower(): row['id'] for row in cur.fetchall()}
-
-            cur.execute("SELECT id, name FROM shop_brand")
-            brands = {row['name'].lower(): row['id'] for row in cur.fetchall()}
+            refs = reference_cache.snapshot(cur)
 
             with open(filepath, 'r', encoding='utf-8') as csvfile:
                 reader = csv.DictReader(csvfile)
@@ -172,8 +169,10 @@ class ImportService:
                         category_name = row.get('category', '').strip().lower()
                         brand_name = row.get('brand', '').strip().lower()
 
-                        category_id = categories.get(category_name)
-                        brand_id = brands.get(brand_name)
+                        category = refs.categories_by_name.get(category_name)
+                        brand = refs.brands_by_name.get(brand_name)
+                        category_id = category['id'] if category else None
+                        brand_id = brand['id'] if brand else None
 
                         color = row.get('color', '').strip()
                         material = row.get('material', '').strip()
@@ -184,7 +183,7 @@ class ImportService:
                             'is_published', 'True'
                         ).strip().lower()
                         is_published = is_published_value in [
-                            'true', '1', 'yes', 'да'
+                            'true', 't', '1', 'yes', 'да'
                         ]
 
                         if not name or not sku:
@@ -318,6 +317,7 @@ class ImportService:
                         continue
 
             cur.connection.commit()
+            suggest_index.invalidate()
 
             return {
                 'success': True,
@@ -403,6 +403,8 @@ class ImportService:
                         continue
 
             cur.connection.commit()
+            reference_cache.invalidate()
+            suggest_index.invalidate()
 
             return {
                 'success': True,
@@ -454,7 +456,7 @@ class ImportService:
                             'is_published', 'True'
                         ).strip().lower()
                         is_published = is_published_value in [
-                            'true', '1', 'yes', 'да'
+                            'true', 't', '1', 'yes', 'да'
                         ]
 
                         cur.execute("""
@@ -490,6 +492,8 @@ class ImportService:
                         continue
 
             cur.connection.commit()
+            reference_cache.invalidate()
+            suggest_index.invalidate()
 
             return {
                 'success': True,
@@ -3,12 +3,12 @@ from flask_login import login_required
 
 from .decorators import admin_required
 from .views import (
-    dashboard,
+    dashboard, cache_stats,
     users, edit_user, delete_user,
     products, create_product, edit_product, delete_product,
     admin_categories, create_category, edit_category, delete_category,
     admin_brands, create_brand, edit_brand, delete_brand,
-    export_data, download_export, generate_export, delete_export, quick_export,
+    export_data, download_export, generate_export, delete_export, quick_export, stream_export,
     import_data, download_import_template, upload_import, view_import_errors, preview_import
 )
 
@@ -16,6 +16,7 @@ admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
 # Дашборд
 admin_bp.route('/')(login_required(admin_required(dashboard)))
+admin_bp.route('/api/cache-stats')(login_required(admin_required(cache_stats)))
 
 # Пользователи
 admin_bp.route('/users')(login_required(admin_required(users)))
@@ -79,6 +80,9 @@ admin_bp.route('/export/delete/<filename>', methods=['POST'])(
 admin_bp.route('/api/export/quick', methods=['POST'])(
     login_required(admin_required(quick_export))
 )
+admin_bp.route('/export/stream/<export_type>')(
+    login_required(admin_required(stream_export))
+)
 
 # Импорт
 admin_bp.route('/import')(login_required(admin_required(import_data)))
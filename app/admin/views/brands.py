@@ -4,6 +4,8 @@ from psycopg2 import Error
 
 from ..decorators import admin_required
 from app.database import get_cursor
+from app.autocomplete import brand_changed, suggest_index
+from app.reference_cache import reference_cache
 
 
 def format_date(date_obj):
@@ -73,9 +75,13 @@ def create_brand():
                         name, description, is_published, created_at
                         )
                 VALUES (%s, %s, %s, NOW())
+                RETURNING id
             """, (name, description, is_published))
+            brand_id = cur.fetchone()["id"]
 
             cur.connection.commit()
+            reference_cache.invalidate()
+            brand_changed(brand_id, name, is_published)
             flash(f'Бренд "{name}" успешно создан', "success")
             return redirect(url_for("admin.admin_brands"))
 
@@ -111,6 +117,8 @@ def edit_brand(brand_id):
             """, (name, description, is_published, brand_id))
 
             cur.connection.commit()
+            reference_cache.invalidate()
+            brand_changed(brand_id, name, is_published)
             flash("Бренд успешно обновлён", "success")
             return redirect(url_for("admin.admin_brands"))
 
@@ -149,6 +157,8 @@ def delete_brand(brand_id):
 
         cur.execute("DELETE FROM shop_brand WHERE id = %s", (brand_id,))
         cur.connection.commit()
+        reference_cache.invalidate()
+        suggest_index.remove('brand', brand_id)
 
         flash("Бренд удалён", "success")
         return redirect(url_for("admin.admin_brands"))
@@ -7,6 +7,8 @@ from flask_login import login_required
 import re
 from ..decorators import admin_required
 from app.database import get_cursor
+from app.autocomplete import category_changed, suggest_index
+from app.reference_cache import reference_cache
 
 
 def generate_slug(name: str) -> str:
@@ -67,9 +69,13 @@ def create_category():
             cur.execute("""
                 INSERT INTO categories (name, slug, description, created_at)
                 VALUES (%s, %s, %s, NOW())
+                RETURNING id, is_published
             """, (name, slug, description))
+            created = cur.fetchone()
 
             cur.connection.commit()
+            reference_cache.invalidate()
+            category_changed(created['id'], name, slug, created['is_published'])
             flash(f'Категория "{name}" успешно создана', "success")
             return redirect(url_for("admin.admin_categories"))
 
@@ -111,9 +117,14 @@ def edit_category(category_id):
                 UPDATE categories
                 SET name = %s, slug = %s, description = %s, updated_at = NOW()
                 WHERE id = %s
+                RETURNING is_published
             """, (name, slug, description, category_id))
+            updated = cur.fetchone()
 
             cur.connection.commit()
+            reference_cache.invalidate()
+            if updated:
+                category_changed(category_id, name, slug, updated['is_published'])
             flash("Категория успешно обновлена", "success")
             return redirect(url_for("admin.admin_categories"))
 
@@ -172,6 +183,8 @@ def delete_category():
 
         cur.execute("DELETE FROM categories WHERE id = %s", (category_id,))
         cur.connection.commit()
+        reference_cache.invalidate()
+        suggest_index.remove('category', int(category_id))
 
         if request.is_json:
             return jsonify({
@@ -1,7 +1,9 @@
-from flask import render_template, flash
+from flask import render_template, flash, jsonify
 from flask_login import login_required
 from ..decorators import admin_required
-from app.database import get_cursor
+from app.database import get_cursor, get_pool_stats
+from app.facets import facet_cache
+from app.reference_cache import reference_cache
 
 
 def format_date(date_obj):
@@ -38,6 +40,18 @@ def dashboard():
                                recent_activities=[])
 
 
+@login_required
+@admin_required
+def cache_stats():
+    """Статистика кешей и пула соединений (JSON)"""
+    return jsonify({
+        'success': True,
+        'reference_cache': reference_cache.stats(),
+        'facet_cache': facet_cache.stats(),
+        'db_pool': get_pool_stats()
+    })
+
+
 def _get_dashboard_stats(cur):
     """Получить статистику для дашборда"""
     stats = {}
@@ -102,7 +116,7 @@ def _get_recent_products(cur):
     try:
         cur.execute("""
             SELECT p.id, p.name, p.price, p.stock, p.is_published, p.created_at,
-                   (SELECT image_url FROM product_images WHERE product_id = p.id AND is_main = TRUE LIMIT 1) as main_image
+                   p.main_image_url as main_image
             FROM products p
             ORDER BY p.created_at DESC
             LIMIT 5
@@ -2,7 +2,8 @@
 Экспорт и импорт данных
 """
 
-from flask import render_template, flash, redirect, url_for, request, jsonify, send_file, session
+from flask import (render_template, flash, redirect, url_for, request, jsonify, send_file, session,
+                   Response, stream_with_context)
 from flask_login import login_required
 from werkzeug.utils import secure_filename
 import os
@@ -205,6 +206,32 @@ def quick_export():
         return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'})
 
 
+@login_required
+@admin_required
+def stream_export(export_type):
+    """Скачать CSV сразу, без файла на сервере (строки читаются порциями)"""
+    export_service = ExportService()
+    export = export_service.stream_export(
+        export_type,
+        start_date=request.args.get('start_date') or None,
+        end_date=request.args.get('end_date') or None
+    )
+
+    if export is None:
+        flash('Этот тип экспорта нельзя скачать напрямую', 'danger')
+        return redirect(url_for('admin.export_data'))
+
+    filename, chunks = export
+    return Response(
+        stream_with_context(chunks),
+        mimetype='text/csv; charset=utf-8',
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
 @login_required
 @admin_required
 def import_data():
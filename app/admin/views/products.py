@@ -2,7 +2,7 @@
 Управление товарами
 """
 
-from flask import render_template, flash, redirect, url_for, request
+from flask import render_template, flash, redirect, url_for, request, current_app
 from flask_login import login_required
 from werkzeug.utils import secure_filename
 import os
@@ -11,6 +11,10 @@ from psycopg2 import Error
 from app.forms.product import ProductForm
 from ..decorators import admin_required
 from app.database import get_cursor
+from app.autocomplete import product_changed, suggest_index
+from app.search import product_search
+from app.reference_cache import reference_cache
+from app.media import media_manifest
 
 
 def format_date(date_obj):
@@ -59,14 +63,12 @@ def products():
 
 def _get_categories(cur):
     """Получить список категорий"""
-    cur.execute("SELECT id, name FROM categories ORDER BY name")
-    return [{'id': cat['id'], 'name': cat['name']} for cat in cur.fetchall()]
+    return [{'id': cat['id'], 'name': cat['name']} for cat in reference_cache.categories(cur)]
 
 
 def _get_brands(cur):
     """Получить список брендов"""
-    cur.execute("SELECT id, name FROM shop_brand ORDER BY name")
-    return [{'id': brand['id'], 'name': brand['name']} for brand in cur.fetchall()]
+    return [{'id': brand['id'], 'name': brand['name']} for brand in reference_cache.brands(cur)]
 
 
 def _get_filtered_products(cur, category_id, brand_id, status, search):
@@ -106,12 +108,15 @@ def _get_filtered_products(cur, category_id, brand_id, status, search):
     elif status == 'draft':
         query += " AND p.is_published = FALSE"
     
+    order_by = "p.created_at DESC"
     if search:
-        query += " AND (p.name ILIKE %s OR p.sku ILIKE %s)"
-        search_term = f"%{search}%"
-        params.extend([search_term, search_term])
+        search_clause = product_search(cur, search)
+        query += f" AND {search_clause.condition}"
+        params.extend(search_clause.params)
+        order_by = f"{search_clause.rank} DESC, {order_by}"
+        params.extend(search_clause.rank_params)
     
-    query += " ORDER BY p.created_at DESC"
+    query += f" ORDER BY {order_by}"
     cur.execute(query, params)
     
     # Форматирование результата
@@ -194,6 +199,7 @@ def _handle_product_creation(cur, form):
         _save_product_images(cur, product_id, form.images.data)
         
         cur.connection.commit()
+        product_changed(product_id, form.name.data, form.is_published.data)
         
         flash('Товар успешно создан!', 'success')
         return redirect(url_for('admin.products'))
@@ -212,13 +218,14 @@ def _save_product_images(cur, product_id, images_data):
     for i, image_file in enumerate(images_data):
         if image_file and image_file.filename:
             # Создание директории
-            upload_dir = os.path.join('static', 'uploads', 'products')
+            upload_dir = os.path.join(current_app.static_folder, 'uploads', 'products')
             os.makedirs(upload_dir, exist_ok=True)
             
             # Сохранение файла
             filename = secure_filename(f"{product_id}_{i}_{image_file.filename}")
             filepath = os.path.join(upload_dir, filename)
             image_file.save(filepath)
+            media_manifest.add('uploads/products', filename)
             
             # Сохранение в БД
             db_url = f"/static/uploads/products/{filename}"
@@ -382,6 +389,7 @@ def _handle_product_update(cur, form, product_id):
         _update_product_sizes(cur, product_id, form)
         
         cur.connection.commit()
+        product_changed(product_id, form.name.data, form.is_published.data)
         
         flash('Товар успешно обновлен!', 'success')
         return redirect(url_for('admin.products'))
@@ -421,12 +429,13 @@ def _update_product_images(cur, product_id, images_data):
     
     for i, image_file in enumerate(images_data):
         if image_file and image_file.filename:
-            upload_dir = os.path.join('static', 'uploads', 'products')
+            upload_dir = os.path.join(current_app.static_folder, 'uploads', 'products')
             os.makedirs(upload_dir, exist_ok=True)
             
             filename = secure_filename(f"{product_id}_{max_order + i + 1}_{image_file.filename}")
             filepath = os.path.join(upload_dir, filename)
             image_file.save(filepath)
+            media_manifest.add('uploads/products', filename)
             
             db_url = f"/static/uploads/products/{filename}"
             
@@ -468,6 +477,7 @@ def delete_product(product_id):
         # Удаление товара
         cur.execute("DELETE FROM products WHERE id = %s", (product_id,))
         cur.connection.commit()
+        suggest_index.remove('product', product_id)
         
         flash(f'Товар "{product["name"]}" успешно удален!', 'success')
         return redirect(url_for('admin.products'))
@@ -0,0 +1,257 @@
+"""
+Автодополнение поиска: префиксный индекс в памяти процесса.
+
+Названия товаров, брендов и категорий хранятся в отсортированном массиве
+ключей, поиск по префиксу - bisect, без обращения к PostgreSQL. Для
+коротких префиксов (до SHORT_PREFIX символов) диапазон ключей велик,
+поэтому лучшие совпадения для них считаются заранее - при построении
+индекса и при точечных изменениях; для длинных префиксов ранжируется весь
+диапазон. Индекс строится при первом запросе, точечно обновляется из
+админки и полностью перестраивается раз в AUTOCOMPLETE_REFRESH_SECONDS,
+чтобы подхватить изменения, сделанные другими процессами.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+
+from flask import current_app
+
+KINDS = ('product', 'brand', 'category')
+
+# Префиксы такой длины и короче отвечаются из заранее посчитанных списков
+SHORT_PREFIX = 2
+# Сколько лучших совпадений каждого вида хранить для короткого префикса
+TOP_K = 10
+
+
+def normalize(text):
+    return ' '.join((text or '').lower().replace('ё', 'е').split())
+
+
+def _keys_for(name):
+    """Ключи для названия: с начала и с начала каждого следующего слова"""
+    words = normalize(name).split(' ')
+    return [' '.join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+def _short_prefixes(name):
+    return {key[:n] for key in _keys_for(name) for n in range(1, SHORT_PREFIX + 1)}
+
+
+def _scan(keys, entries, prefix):
+    """Все записи с ключом на prefix: {(вид, id): совпадение с начала названия}"""
+    candidates = {}
+    pos = bisect_left(keys, (prefix,))
+    while pos < len(keys):
+        key, kind, item_id = keys[pos]
+        if not key.startswith(prefix):
+            break
+        ref = (kind, item_id)
+        # Совпадение с начала названия важнее совпадения с середины
+        from_start = key == normalize(entries[ref]['name'])
+        if ref not in candidates or from_start:
+            candidates[ref] = from_start
+        pos += 1
+    return candidates
+
+
+def _best(entries, candidates, limit):
+    """Лучшие limit записей каждого вида: {вид: [(вид, id), ...]}"""
+    by_kind = {kind: [] for kind in KINDS}
+    for ref, from_start in candidates.items():
+        by_kind[ref[0]].append((ref, from_start))
+
+    def rank(item):
+        entry = entries[item[0]]
+        return (not item[1], -entry.get('weight', 0), len(entry['name']))
+
+    return {kind: [ref for ref, _ in heapq.nsmallest(limit, items, key=rank)]
+            for kind, items in by_kind.items()}
+
+
+class PrefixIndex:
+    """Отсортированный массив ключей (ключ, вид, id) с поиском по префиксу"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._keys = []
+        self._entries = {}
+        self._top = {}
+        # Изменения, пришедшие во время перестройки (None - перестройки нет)
+        self._pending = None
+        self.loaded_at = None
+
+    def start_load(self):
+        """Начать перестройку: изменения до load() будут применены к новому индексу"""
+        with self._lock:
+            self._pending = []
+
+    def abort_load(self):
+        with self._lock:
+            self._pending = None
+
+    def load(self, entries):
+        """Полностью заменить содержимое индекса"""
+        keys = []
+        by_ref = {}
+        for entry in entries:
+            ref = (entry['kind'], entry['id'])
+            by_ref[ref] = entry
+            keys.extend((key, *ref) for key in _keys_for(entry['name']))
+        keys.sort()
+
+        prefixes = {key[:n] for key, _, _ in keys for n in range(1, SHORT_PREFIX + 1)}
+        top = {prefix: _best(by_ref, _scan(keys, by_ref, prefix), TOP_K)
+               for prefix in prefixes}
+
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._keys = keys
+            self._entries = by_ref
+            self._top = top
+            for kind, item_id, name, extra in pending or ():
+                if name is None:
+                    self._remove(kind, item_id)
+                else:
+                    self._upsert(kind, item_id, name, extra)
+            self.loaded_at = time.monotonic()
+
+    def upsert(self, kind, item_id, name, **extra):
+        """Добавить или обновить одну запись"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((kind, item_id, name, extra))
+            self._upsert(kind, item_id, name, extra)
+
+    def remove(self, kind, item_id):
+        """Удалить запись"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((kind, item_id, None, None))
+            self._remove(kind, item_id)
+
+    def _upsert(self, kind, item_id, name, extra):
+        previous = self._entries.get((kind, item_id), {})
+        affected = _short_prefixes(name)
+        if previous:
+            affected |= _short_prefixes(previous['name'])
+        self._remove_keys(kind, item_id)
+        self._entries[(kind, item_id)] = {**previous, 'kind': kind, 'id': item_id,
+                                          'name': name, **extra}
+        for key in _keys_for(name):
+            insort(self._keys, (key, kind, item_id))
+        self._refresh_top(affected)
+
+    def _remove(self, kind, item_id):
+        entry = self._entries.get((kind, item_id))
+        if not entry:
+            return
+        self._remove_keys(kind, item_id)
+        del self._entries[(kind, item_id)]
+        self._refresh_top(_short_prefixes(entry['name']))
+
+    def _remove_keys(self, kind, item_id):
+        entry = self._entries.get((kind, item_id))
+        if not entry:
+            return
+        for key in _keys_for(entry['name']):
+            item = (key, kind, item_id)
+            pos = bisect_left(self._keys, item)
+            if pos < len(self._keys) and self._keys[pos] == item:
+                del self._keys[pos]
+
+    def _refresh_top(self, prefixes):
+        for prefix in prefixes:
+            candidates = _scan(self._keys, self._entries, prefix)
+            if candidates:
+                self._top[prefix] = _best(self._entries, candidates, TOP_K)
+            else:
+                self._top.pop(prefix, None)
+
+    def search(self, prefix, limit=5):
+        """Лучшие совпадения по префиксу, сгруппированные по виду"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return {kind: [] for kind in KINDS}
+
+        with self._lock:
+            if len(prefix) <= SHORT_PREFIX and limit <= TOP_K:
+                best = self._top.get(prefix) or {kind: [] for kind in KINDS}
+            else:
+                best = _best(self._entries, _scan(self._keys, self._entries, prefix), limit)
+            return {kind: [self._entries[ref] for ref in refs[:limit]]
+                    for kind, refs in best.items()}
+
+    def is_stale(self, max_age):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > max_age
+
+    def invalidate(self):
+        self.loaded_at = None
+
+
+suggest_index = PrefixIndex()
+_load_lock = threading.Lock()
+
+
+def _fetch_entries(cur):
+    entries = []
+
+    cur.execute("""
+        SELECT id, name, COALESCE(views, 0) AS views
+        FROM products
+        WHERE is_published = TRUE
+    """)
+    entries.extend({'kind': 'product', 'id': row['id'], 'name': row['name'],
+                    'weight': row['views']} for row in cur.fetchall())
+
+    cur.execute("SELECT id, name FROM shop_brand WHERE is_published = TRUE")
+    entries.extend({'kind': 'brand', 'id': row['id'], 'name': row['name']}
+                   for row in cur.fetchall())
+
+    cur.execute("SELECT id, name, slug FROM categories WHERE is_published = TRUE")
+    entries.extend({'kind': 'category', 'id': row['id'], 'name': row['name'],
+                    'slug': row['slug']} for row in cur.fetchall())
+
+    return entries
+
+
+def ensure_loaded(cur):
+    """Построить индекс, если он ещё не построен или устарел"""
+    max_age = current_app.config.get('AUTOCOMPLETE_REFRESH_SECONDS', 300)
+    if not suggest_index.is_stale(max_age):
+        return
+    with _load_lock:
+        if suggest_index.is_stale(max_age):
+            # Правки из админки во время выборки не должны потеряться при замене
+            suggest_index.start_load()
+            try:
+                entries = _fetch_entries(cur)
+            except Exception:
+                suggest_index.abort_load()
+                raise
+            suggest_index.load(entries)
+
+
+def product_changed(product_id, name, is_published=True):
+    """Обновить товар в индексе после сохранения в админке"""
+    if is_published and name:
+        suggest_index.upsert('product', product_id, name)
+    else:
+        suggest_index.remove('product', product_id)
+
+
+def brand_changed(brand_id, name, is_published=True):
+    """Обновить бренд в индексе после сохранения в админке"""
+    if is_published and name:
+        suggest_index.upsert('brand', brand_id, name)
+    else:
+        suggest_index.remove('brand', brand_id)
+
+
+def category_changed(category_id, name, slug, is_published=True):
+    """Обновить категорию в индексе после сохранения в админке"""
+    if is_published and name:
+        suggest_index.upsert('category', category_id, name, slug=slug)
+    else:
+        suggest_index.remove('category', category_id)
@@ -0,0 +1,233 @@
+"""
+Массовая рассылка по пользователям (`flask send-bulk-mail`).
+
+Шаблон компилируется один раз на рассылку и рендерится для каждого
+получателя с его личными полями (username, first_name, last_name, email)
+в контексте, поэтому фильтры и условия работают с настоящими значениями:
+`{{ first_name|title }}`, `{% if first_name %}...{% endif %}`.
+
+Письма отправляют BULK_MAIL_CONNECTIONS потоков, каждый через одно
+постоянное SMTP-соединение; общий темп ограничен BULK_MAIL_RATE писем в
+секунду. Результат по каждому получателю записывается в
+bulk_mail_deliveries после каждой порции, поэтому прерванную рассылку
+можно запустить повторно с тем же именем - уже доставленные письма не
+отправляются, а неудачные повторяются.
+"""
+import logging
+import queue
+import threading
+import time
+
+from psycopg2.extras import execute_values
+
+from app.database import get_pool
+from app.outbox import SMTPConnection, build_message
+
+logger = logging.getLogger(__name__)
+
+SENT = 'sent'
+FAILED = 'failed'
+
+PERSONAL_FIELDS = ('username', 'first_name', 'last_name', 'email')
+
+
+class CampaignMismatch(Exception):
+    """Рассылка с таким именем уже запускалась с другим шаблоном или темой"""
+
+
+class RateLimiter:
+    """Общий для всех потоков предел писем в секунду"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class CampaignTemplate:
+    """Шаблон письма, скомпилированный один раз на рассылку"""
+
+    def __init__(self, app, template_name, subject, context=None):
+        self.template = app.jinja_env.get_template(template_name)
+        # Тема - обычный текст, HTML-экранирование ей не нужно
+        self.subject = app.jinja_env.overlay(autoescape=False).from_string(subject)
+        self.context = dict(context or {})
+
+    def render(self, recipient):
+        """Тема и HTML письма для получателя"""
+        context = dict(self.context)
+        for field in PERSONAL_FIELDS:
+            context[field] = recipient.get(field) or ''
+        return self.subject.render(context), self.template.render(context)
+
+
+def _start_campaign(conn, name, template_name, subject):
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO bulk_mail_campaigns (name, template, subject)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (name) DO NOTHING
+        """, (name, template_name, subject))
+        cur.execute("""
+            SELECT template, subject FROM bulk_mail_campaigns WHERE name = %s
+        """, (name,))
+        stored = cur.fetchone()
+    conn.commit()
+    if tuple(stored) != (template_name, subject):
+        raise CampaignMismatch(
+            f'Рассылка {name} уже запускалась с шаблоном {stored[0]} и темой "{stored[1]}"'
+        )
+
+
+def _next_recipients(conn, name, after_id, limit, verified_only):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT u.id, u.username, u.first_name, u.last_name, u.email
+            FROM users u
+            WHERE u.id > %s
+              AND u.email IS NOT NULL AND u.email <> ''
+              AND (u.email_verified OR NOT %s)
+              AND NOT EXISTS (
+                  SELECT 1 FROM bulk_mail_deliveries d
+                  WHERE d.campaign = %s AND d.user_id = u.id AND d.status = %s
+              )
+            ORDER BY u.id
+            LIMIT %s
+        """, (after_id, verified_only, name, SENT, limit))
+        columns = [c.name for c in cur.description]
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+def _record(conn, name, results):
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            INSERT INTO bulk_mail_deliveries (campaign, user_id, status, error, updated_at)
+            VALUES %s
+            ON CONFLICT (campaign, user_id) DO UPDATE
+                SET status = EXCLUDED.status,
+                    error = EXCLUDED.error,
+                    updated_at = EXCLUDED.updated_at
+        """, [(name, user_id, FAILED if error else SENT, error) for user_id, error in results],
+            template="(%s, %s, %s, %s, NOW())")
+    conn.commit()
+
+
+def _finish_campaign(conn, name):
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE bulk_mail_campaigns SET finished_at = NOW() WHERE name = %s
+        """, (name,))
+    conn.commit()
+
+
+def send_campaign(app, name, template_name, subject, verified_only=True,
+                  rate=None, connections=None, progress=None):
+    """Разослать письмо всем подходящим пользователям.
+
+    Возвращает словарь с числом отправленных и неудачных писем.
+    """
+    config = app.config
+    rate = config.get('BULK_MAIL_RATE', 10) if rate is None else rate
+    connections = connections or config.get('BULK_MAIL_CONNECTIONS', 3)
+    batch_size = config.get('BULK_MAIL_BATCH_SIZE', 500)
+    sender = config.get('MAIL_DEFAULT_SENDER') or config.get('MAIL_USERNAME')
+
+    with app.app_context():
+        campaign = CampaignTemplate(app, template_name, subject, context={
+            'app_name': config.get('APP_NAME', 'Shoe Shop'),
+            'base_url': config.get('BASE_URL', 'http://localhost:5000'),
+        })
+
+    limiter = RateLimiter(rate)
+    tasks = queue.Queue(maxsize=connections * 2)
+    results = []
+    results_lock = threading.Lock()
+
+    def worker():
+        smtp = SMTPConnection(config)
+        context = app.app_context()
+        context.push()
+        try:
+            while True:
+                recipient = tasks.get()
+                if recipient is None:
+                    tasks.task_done()
+                    return
+                error = None
+                try:
+                    subject_text, html = campaign.render(recipient)
+                    limiter.wait()
+                    smtp.send(build_message({
+                        'recipient': recipient['email'],
+                        'subject': subject_text,
+                        'html_body': html,
+                        'text_body': None,
+                    }, sender))
+                except Exception as e:
+                    smtp.close()
+                    error = str(e)[:1000]
+                    logger.warning('Рассылка %s: письмо на %s не отправлено: %s',
+                                   name, recipient['email'], e)
+                with results_lock:
+                    results.append((recipient['id'], error))
+                tasks.task_done()
+        finally:
+            smtp.close()
+            context.pop()
+
+    threads = [
+        threading.Thread(target=worker, name=f'bulk-mail-{i}', daemon=True)
+        for i in range(connections)
+    ]
+    for thread in threads:
+        thread.start()
+
+    pool = get_pool(app)
+    conn = pool.getconn()
+    totals = {'sent': 0, 'failed': 0}
+    try:
+        _start_campaign(conn, name, template_name, subject)
+        after_id = 0
+        while True:
+            batch = _next_recipients(conn, name, after_id, batch_size, verified_only)
+            if not batch:
+                break
+            for recipient in batch:
+                tasks.put(recipient)
+            tasks.join()
+
+            with results_lock:
+                done, results[:] = list(results), []
+            _record(conn, name, done)
+
+            failed = sum(1 for _, error in done if error)
+            totals['failed'] += failed
+            totals['sent'] += len(done) - failed
+            after_id = batch[-1]['id']
+            if progress:
+                progress(totals)
+
+        _finish_campaign(conn, name)
+        return totals
+    finally:
+        for _ in threads:
+            tasks.put(None)
+        for thread in threads:
+            thread.join(5)
+        # При прерывании сохранить то, что успели отправить
+        if results:
+            try:
+                _record(conn, name, results)
+            except Exception as e:
+                logger.warning('Рассылка %s: не удалось сохранить прогресс: %s', name, e)
+        pool.putconn(conn)
@@ -0,0 +1,83 @@
+"""
+Количество товаров в корзине для бейджа в шапке.
+
+Значение запоминается на время запроса (flask.g) и кешируется в сессии
+пользователя - так оно одинаково для всех процессов, обслуживающих этого
+пользователя. Операции с корзиной сразу записывают новое значение в кеш
+(set_cart_count / adjust_cart_count), поэтому обычный просмотр страниц
+не обращается к БД. Изменения с другого устройства подхватываются не
+позже чем через CART_COUNT_CACHE_SECONDS.
+"""
+import time
+
+from flask import g, session, current_app
+from flask_login import current_user
+
+from app.database import get_cursor
+
+SESSION_KEY = 'cart_count'
+
+
+def _cached(user_id):
+    entry = session.get(SESSION_KEY)
+    if not entry or entry.get('user_id') != user_id:
+        return None
+    max_age = current_app.config.get('CART_COUNT_CACHE_SECONDS', 300)
+    if time.time() - entry.get('at', 0) > max_age:
+        return None
+    return entry.get('count')
+
+
+def _store(user_id, count):
+    count = max(int(count or 0), 0)
+    session[SESSION_KEY] = {'user_id': user_id, 'count': count, 'at': time.time()}
+    g.cart_count = count
+    return count
+
+
+def get_cart_count():
+    """Количество товаров в корзине текущего пользователя"""
+    if 'cart_count' in g:
+        return g.cart_count
+
+    if current_user.is_authenticated:
+        count = _cached(current_user.id)
+        if count is None:
+            # Соединение запроса из пула - отдельное подключение не открывается
+            with get_cursor() as cur:
+                cur.execute("""
+                    SELECT COALESCE(SUM(quantity), 0) as total
+                    FROM cart_items
+                    WHERE user_id = %s
+                """, (current_user.id,))
+                count = _store(current_user.id, cur.fetchone()['total'])
+    else:
+        cart = session.get('cart', {})
+        count = sum(cart.values()) if cart else 0
+
+    g.cart_count = count
+    return count
+
+
+def set_cart_count(count):
+    """Записать новое количество после изменения корзины"""
+    if current_user.is_authenticated:
+        return _store(current_user.id, count)
+    return count
+
+
+def adjust_cart_count(delta):
+    """Изменить закешированное количество на delta (если оно известно)"""
+    if not current_user.is_authenticated:
+        return
+    count = _cached(current_user.id)
+    if count is None:
+        forget_cart_count()
+    else:
+        _store(current_user.id, count + delta)
+
+
+def forget_cart_count():
+    """Сбросить кеш: количество будет пересчитано при следующем обращении"""
+    session.pop(SESSION_KEY, None)
+    g.pop('cart_count', None)
@@ -1,42 +1,75 @@
+import threading
+
 from flask import g, current_app
-import psycopg2
-from psycopg2.extras import DictCursor
+
+from app.db_instrumentation import InstrumentedCursor
+from app.db_pool import ConnectionPool, PooledConnection
+
+_pool_lock = threading.Lock()
+
+
+def get_pool(app=None):
+    """Пул соединений приложения (создаётся при первом обращении)"""
+    app = app or current_app._get_current_object()
+    pool = app.extensions.get('db_pool')
+    if pool is None:
+        with _pool_lock:
+            pool = app.extensions.get('db_pool')
+            if pool is None:
+                config = app.config
+                pool = ConnectionPool(
+                    min_size=config.get('DB_POOL_MIN_SIZE', 1),
+                    max_size=config.get('DB_POOL_MAX_SIZE', 10),
+                    timeout=config.get('DB_POOL_TIMEOUT', 10.0),
+                    pre_ping=config.get('DB_POOL_PRE_PING', True),
+                    ping_interval=config.get('DB_POOL_PING_INTERVAL', 10.0),
+                    # Порог нечёткого поиска задаётся каждому соединению:
+                    # ALTER DATABASE требует прав владельца базы
+                    options='-c pg_trgm.word_similarity_threshold={}'.format(
+                        config.get('SEARCH_WORD_SIMILARITY_THRESHOLD', 0.45)
+                    ),
+                    host=config['DB_HOST'],
+                    database=config['DB_NAME'],
+                    user=config['DB_USER'],
+                    password=config['DB_PASSWORD'],
+                    port=config['DB_PORT']
+                )
+                app.extensions['db_pool'] = pool
+    return pool
+
+
+def get_pool_stats(app=None):
+    """Статистика пула: занятые/свободные соединения, время ожидания"""
+    return get_pool(app).stats()
 
 
 def get_db():
     """Получить соединение с базой данных"""
     if 'db' not in g:
-        g.db = psycopg2.connect(
-            host=current_app.config['DB_HOST'],
-            database=current_app.config['DB_NAME'],
-            user=current_app.config['DB_USER'],
-            password=current_app.config['DB_PASSWORD'],
-            port=current_app.config['DB_PORT']
-        )
+        pool = get_pool()
+        g.db = PooledConnection(pool, pool.getconn())
     return g.db
 
 
 def get_cursor():
-    """Получить курсор для выполнения запросов"""
-    return get_db().cursor(cursor_factory=DictCursor)
+    """Получить курсор для выполнения запросов (с учётом времени запросов)"""
+    return get_db().cursor(cursor_factory=InstrumentedCursor)
 
 
 def close_db(e=None):
-    """Закрыть соединение с базой"""
+    """Вернуть соединение запроса в пул"""
     db = g.pop('db', None)
     if db is not None:
         db.close()
 
 
 def get_db_connection():
-    """Создать новое соединение с БД (для использования вне запроса)"""
-    return psycopg2.connect(
-        host=current_app.config['DB_HOST'],
-        database=current_app.config['DB_NAME'],
-        user=current_app.config['DB_USER'],
-        password=current_app.config['DB_PASSWORD'],
-        port=current_app.config['DB_PORT']
-    )
+    """Взять отдельное соединение из пула (для использования вне запроса).
+
+    close() возвращает соединение в пул, а не разрывает его.
+    """
+    pool = get_pool()
+    return PooledConnection(pool, pool.getconn())
 
 
 def safe_fetchall(cursor, sql, params=None):
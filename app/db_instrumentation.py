@@ -0,0 +1,137 @@
+"""
+Учёт SQL-запросов в рамках HTTP-запроса: количество, время, медленные
+запросы и повторяющиеся запросы (N+1)
+"""
+import re
+import time
+from functools import lru_cache
+
+from flask import g, current_app, has_app_context
+from psycopg2.extras import DictCursor
+
+_COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER_RE = re.compile(r'%\(\w+\)s|%s')
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """Нормализованный текст запроса без литералов и параметров"""
+    sql = _COMMENT_RE.sub(' ', sql)
+    sql = _STRING_RE.sub('?', sql)
+    sql = _PLACEHOLDER_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _LIST_RE.sub('(?+)', sql)
+    return _SPACE_RE.sub(' ', sql).strip().lower()
+
+
+class QueryLog:
+    """Журнал SQL-запросов одного HTTP-запроса"""
+
+    def __init__(self):
+        self.queries = []
+        self.total_time = 0.0
+        self.counts = {}
+        self.warned = set()
+
+    def add(self, sql, duration, rowcount):
+        fp = fingerprint(sql)
+        self.queries.append({'fingerprint': fp, 'duration': duration, 'rowcount': rowcount})
+        self.total_time += duration
+        self.counts[fp] = self.counts.get(fp, 0) + 1
+        return fp, self.counts[fp]
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total_time': self.total_time,
+            'queries': list(self.queries),
+            'repeated': {fp: n for fp, n in self.counts.items() if n > 1},
+        }
+
+
+def get_query_log():
+    """Журнал текущего запроса (None вне контекста приложения)"""
+    if not has_app_context():
+        return None
+    if 'sql_log' not in g:
+        g.sql_log = QueryLog()
+    return g.sql_log
+
+
+def get_request_query_stats():
+    """Сводка по SQL-запросам текущего HTTP-запроса"""
+    log = get_query_log()
+    return log.summary() if log else None
+
+
+def _record(sql, duration, rowcount):
+    log = get_query_log()
+    if log is None:
+        return
+
+    fp, seen = log.add(sql, duration, rowcount)
+    config = current_app.config
+    logger = current_app.logger
+
+    slow_ms = config.get('SQL_SLOW_QUERY_MS', 200)
+    if slow_ms is not None and duration * 1000 >= slow_ms:
+        logger.warning(f'Медленный запрос ({duration * 1000:.1f} мс, строк: {rowcount}): {fp}')
+
+    threshold = config.get('SQL_REPEAT_THRESHOLD', 5)
+    if threshold and seen > threshold and fp not in log.warned:
+        log.warned.add(fp)
+        logger.warning(f'Возможная проблема N+1: запрос выполнен более {threshold} раз '
+                       f'за один HTTP-запрос: {fp}')
+
+
+class InstrumentedCursor(DictCursor):
+    """DictCursor, записывающий время и число строк каждого запроса"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _record(self._query_text(query), time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _record(self._query_text(query), time.perf_counter() - started, self.rowcount)
+
+    def _query_text(self, query):
+        if isinstance(query, str):
+            return query
+        if isinstance(query, bytes):
+            return query.decode('utf-8', 'replace')
+        try:
+            return query.as_string(self.connection)
+        except Exception:
+            return str(query)
+
+
+def add_debug_headers(response):
+    """Добавить в ответ число SQL-запросов и суммарное время БД"""
+    if not current_app.config.get('SQL_DEBUG_HEADERS', current_app.debug):
+        return response
+    log = g.get('sql_log')
+    count = log.count if log else 0
+    total_ms = log.total_time * 1000 if log else 0.0
+    response.headers['X-DB-Query-Count'] = str(count)
+    response.headers['X-DB-Time-ms'] = f'{total_ms:.1f}'
+    return response
+
+
+def init_app(app):
+    """Подключить учёт SQL-запросов к приложению"""
+    app.after_request(add_debug_headers)
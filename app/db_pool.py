@@ -0,0 +1,293 @@
+"""
+Пул соединений PostgreSQL
+"""
+import os
+import threading
+import time
+import weakref
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+class PoolTimeout(PoolError):
+    """Не удалось получить соединение из пула за отведённое время"""
+
+
+# Все пулы процесса - чтобы сбросить их в дочернем процессе после fork()
+_pools = weakref.WeakSet()
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений с ограничением размера.
+
+    Соединения выдаются по принципу LIFO, поэтому "горячие" соединения
+    переиспользуются чаще, а лишние простаивают и могут быть проверены
+    перед выдачей (pre-ping).
+    """
+
+    def __init__(self, min_size=1, max_size=10, timeout=10.0,
+                 pre_ping=True, ping_interval=10.0, **connect_kwargs):
+        if max_size < 1:
+            raise ValueError('max_size должен быть больше 0')
+        if min_size < 0 or min_size > max_size:
+            raise ValueError('min_size должен быть в диапазоне 0..max_size')
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+        self.ping_interval = ping_interval
+        self._connect_kwargs = connect_kwargs
+
+        self._init_state()
+        _pools.add(self)
+
+        for _ in range(self.min_size):
+            conn = self._connect()
+            with self._lock:
+                self._size += 1
+                self._idle.append((conn, time.monotonic()))
+
+    def _init_state(self):
+        self._lock = threading.Condition(threading.RLock())
+        self._idle = deque()
+        self._in_use = set()
+        self._size = 0
+        self._waiting = 0
+        self._pid = os.getpid()
+        self._closed = False
+        self._stats = {
+            'checkouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'connections_discarded': 0,
+        }
+
+    # --- выдача и возврат соединений ---
+
+    def getconn(self, timeout=None):
+        """Взять соединение из пула, при необходимости дождавшись свободного"""
+        self._check_pid()
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        conn, last_used = None, None
+
+        with self._lock:
+            if self._closed:
+                raise PoolError('пул соединений закрыт')
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        # Резервируем место, само подключение - вне блокировки
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f'нет свободных соединений за {timeout:.1f} с '
+                            f'(занято {len(self._in_use)} из {self.max_size})'
+                        )
+                    self._lock.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif not self._is_alive(conn, last_used):
+                self._close_quietly(conn)
+                with self._lock:
+                    self._stats['connections_discarded'] += 1
+                conn = self._connect()
+        except Exception:
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            raise
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self._in_use.add(conn)
+            self._stats['checkouts'] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Вернуть соединение в пул (или закрыть, если оно испорчено)"""
+        with self._lock:
+            if conn not in self._in_use:
+                # Соединение унаследовано от родительского процесса или уже возвращено
+                return
+            self._in_use.discard(conn)
+
+        keep = not close and not self._closed and self._reset(conn)
+
+        with self._lock:
+            if keep:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._size -= 1
+                self._stats['connections_discarded'] += 1
+            self._lock.notify()
+
+        if not keep:
+            self._close_quietly(conn)
+
+    def closeall(self):
+        """Закрыть все свободные соединения и запретить выдачу новых"""
+        with self._lock:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._lock.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        """Текущая статистика пула"""
+        with self._lock:
+            checkouts = self._stats['checkouts']
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'wait_time_avg': (self._stats['wait_time_total'] / checkouts
+                                  if checkouts else 0.0),
+                **self._stats,
+            }
+
+    # --- служебные методы ---
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._connect_kwargs)
+        with self._lock:
+            self._stats['connections_created'] += 1
+        return conn
+
+    def _is_alive(self, conn, last_used):
+        if conn.closed:
+            return False
+        if not self.pre_ping or time.monotonic() - last_used < self.ping_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _reset(conn):
+        """Откатить незавершённую транзакцию перед возвратом в пул"""
+        if conn.closed:
+            return False
+        try:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                return False
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+
+    def _reset_after_fork(self):
+        """Забыть соединения родительского процесса.
+
+        Закрывать их нельзя: close() отправит серверу Terminate через общий
+        сокет и оборвёт сессию родителя. Поэтому ссылки сохраняются, чтобы
+        сборщик мусора тоже не закрыл их.
+        """
+        inherited = [conn for conn, _ in self._idle] + list(self._in_use)
+        orphans = getattr(self, '_orphans', [])
+        orphans.extend(inherited)
+        self._init_state()
+        self._orphans = orphans
+
+
+class PooledConnection:
+    """Обёртка над соединением: close() возвращает его в пул"""
+
+    __slots__ = ('_pool', '_conn')
+
+    def __init__(self, pool, conn):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_conn', conn)
+
+    @property
+    def raw(self):
+        return self._conn
+
+    @property
+    def closed(self):
+        return 1 if self._conn is None else self._conn.closed
+
+    def close(self):
+        conn = self._conn
+        if conn is not None:
+            object.__setattr__(self, '_conn', None)
+            self._pool.putconn(conn)
+
+    def __getattr__(self, name):
+        conn = object.__getattribute__(self, '_conn')
+        if conn is None:
+            raise psycopg2.InterfaceError('соединение уже возвращено в пул')
+        return getattr(conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def __del__(self):
+        # Обёртку потеряли без close() (исключение до закрытия) -
+        # соединение всё равно должно вернуться в пул, иначе место в нём
+        # занято навсегда
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def _reset_pools_after_fork():
+    for pool in list(_pools):
+        pool._reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
@@ -0,0 +1,158 @@
+"""
+Фасетные счётчики каталога (категории, бренды, размеры, атрибуты, цены).
+
+Все фасеты считаются одним SQL-запросом: отбор товаров выполняется один
+раз в CTE, а каждая фасета - ветка UNION ALL над ним. Результат кешируется
+в памяти процесса по нормализованному ключу фильтров.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+# Границы ценовых диапазонов, руб.
+PRICE_BUCKETS = (3000, 5000, 10000, 20000)
+
+
+def price_bucket_label(index):
+    """Подпись ценового диапазона по номеру width_bucket"""
+    if index == 0:
+        return f'до {PRICE_BUCKETS[0]}'
+    if index >= len(PRICE_BUCKETS):
+        return f'от {PRICE_BUCKETS[-1]}'
+    return f'{PRICE_BUCKETS[index - 1]}–{PRICE_BUCKETS[index]}'
+
+
+class FacetCache:
+    """LRU-кеш с ограниченным временем жизни записей"""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, ttl):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or time.monotonic() - item[0] > ttl:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._data)}
+
+
+facet_cache = FacetCache()
+
+
+def facet_key(selected_categories, selected_brands, search_query):
+    """Нормализованный ключ фильтров (порядок и регистр не важны)"""
+    return (
+        tuple(sorted(set(selected_categories))),
+        tuple(sorted(set(selected_brands))),
+        ' '.join(search_query.lower().split()),
+    )
+
+
+def get_facets(cur, selected_categories, selected_brands, search_query, search=None):
+    """Счётчики фасет для текущих фильтров (из кеша, если есть).
+
+    Счётчики категорий не учитывают выбранные категории, а счётчики
+    брендов - выбранные бренды: так видно, сколько товаров добавит
+    ещё одна отметка в том же фильтре.
+    """
+    key = facet_key(selected_categories, selected_brands, search_query)
+    ttl = current_app.config.get('FACET_CACHE_SECONDS', 60)
+    facets = facet_cache.get(key, ttl)
+    if facets is None:
+        facets = _compute_facets(cur, selected_categories, selected_brands, search)
+        facet_cache.set(key, facets)
+    return facets
+
+
+def _compute_facets(cur, selected_categories, selected_brands, search):
+    params = []
+
+    in_category = "TRUE"
+    if selected_categories:
+        in_category = "p.category_id = ANY(%s)"
+        params.append(list(selected_categories))
+
+    in_brand = "TRUE"
+    if selected_brands:
+        in_brand = "p.brand_id = ANY(%s)"
+        params.append(list(selected_brands))
+
+    params.append(list(PRICE_BUCKETS))
+
+    where = "p.is_published = TRUE"
+    if search:
+        where += f" AND {search.condition}"
+        params.extend(search.params)
+
+    cur.execute(f"""
+        WITH matched AS (
+            SELECT p.id, p.category_id, p.brand_id,
+                   {in_category} AS in_category,
+                   {in_brand} AS in_brand,
+                   width_bucket(p.price, %s::numeric[]) AS price_bucket
+            FROM products p
+            WHERE {where}
+        ),
+        filtered AS (
+            SELECT id, price_bucket FROM matched WHERE in_category AND in_brand
+        )
+        SELECT 'category' AS facet, NULL::text AS name, category_id::text AS value, COUNT(*) AS cnt
+        FROM matched WHERE in_brand AND category_id IS NOT NULL
+        GROUP BY category_id
+        UNION ALL
+        SELECT 'brand', NULL, brand_id::text, COUNT(*)
+        FROM matched WHERE in_category AND brand_id IS NOT NULL
+        GROUP BY brand_id
+        UNION ALL
+        SELECT 'size', NULL, ps.size::text, COUNT(DISTINCT f.id)
+        FROM filtered f JOIN product_sizes ps ON ps.product_id = f.id
+        WHERE ps.quantity > 0
+        GROUP BY ps.size
+        UNION ALL
+        SELECT 'attribute', pa.attribute_type, pa.value, COUNT(DISTINCT f.id)
+        FROM filtered f JOIN product_attributes pa ON pa.product_id = f.id
+        GROUP BY pa.attribute_type, pa.value
+        UNION ALL
+        SELECT 'price', NULL, price_bucket::text, COUNT(*)
+        FROM filtered WHERE price_bucket IS NOT NULL
+        GROUP BY price_bucket
+    """, params)
+
+    facets = {'category': {}, 'brand': {}, 'size': {}, 'attribute': {}, 'price': []}
+    for row in cur.fetchall():
+        facet, value, cnt = row['facet'], row['value'], row['cnt']
+        if facet in ('category', 'brand'):
+            facets[facet][int(value)] = cnt
+        elif facet == 'size':
+            facets['size'][value] = cnt
+        elif facet == 'attribute':
+            facets['attribute'].setdefault(row['name'], {})[value] = cnt
+        elif facet == 'price':
+            bucket = int(value)
+            facets['price'].append({'bucket': bucket, 'label': price_bucket_label(bucket), 'count': cnt})
+
+    facets['price'].sort(key=lambda item: item['bucket'])
+    return facets
@@ -0,0 +1,106 @@
+"""
+Ключи идемпотентности (заголовок Idempotency-Key) для POST-запросов.
+
+Первый запрос с ключом вставляет строку в idempotency_keys в начале своей
+транзакции и до её завершения держит блокировку: параллельный повтор с
+тем же ключом ждёт на INSERT ... ON CONFLICT, а после фиксации первого
+получает сохранённый ответ. Если первый запрос откатился, ключ свободен
+и повтор выполняется заново. Ключи действуют IDEMPOTENCY_KEY_TTL_HOURS.
+"""
+import hashlib
+import json
+
+from flask import current_app
+from psycopg2 import errors
+from psycopg2.extras import Json
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    """Ключ нельзя использовать для этого запроса"""
+
+    def __init__(self, message, status=409):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def fingerprint(payload):
+    """Хеш тела запроса - повтор с тем же ключом должен совпадать"""
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _ttl_hours():
+    return int(current_app.config.get('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+
+
+def claim(cur, user_id, key, request_hash):
+    """Занять ключ в текущей транзакции.
+
+    Возвращает None, если запрос нужно выполнить, или (status, body)
+    сохранённого ответа для повтора.
+    """
+    if len(key) > MAX_KEY_LENGTH:
+        raise IdempotencyConflict('Слишком длинный Idempotency-Key', status=400)
+
+    wait = current_app.config.get('IDEMPOTENCY_LOCK_TIMEOUT', '30s')
+    cur.execute("SELECT set_config('lock_timeout', %s, true)", (wait,))
+
+    try:
+        # Просроченный ключ перезанимается; действующий - ждём и читаем ответ
+        cur.execute("""
+            INSERT INTO idempotency_keys (user_id, key, request_hash, created_at)
+            VALUES (%s, %s, %s, NOW())
+            ON CONFLICT (user_id, key) DO UPDATE
+                SET request_hash = EXCLUDED.request_hash,
+                    status_code = NULL,
+                    response = NULL,
+                    created_at = NOW()
+                WHERE idempotency_keys.created_at < NOW() - make_interval(hours => %s)
+            RETURNING key
+        """, (user_id, key, request_hash, _ttl_hours()))
+        claimed = cur.fetchone()
+    except errors.LockNotAvailable:
+        cur.connection.rollback()
+        raise IdempotencyConflict('Запрос с этим ключом ещё выполняется')
+
+    cur.execute("SELECT set_config('lock_timeout', '0', true)")
+
+    if claimed:
+        return None
+
+    cur.execute("""
+        SELECT request_hash, status_code, response
+        FROM idempotency_keys
+        WHERE user_id = %s AND key = %s
+    """, (user_id, key))
+    stored = cur.fetchone()
+
+    if stored['request_hash'] != request_hash:
+        raise IdempotencyConflict('Idempotency-Key уже использован с другими данными', status=422)
+
+    if stored['status_code'] is None:
+        raise IdempotencyConflict('Запрос с этим ключом ещё выполняется')
+
+    return stored['status_code'], stored['response']
+
+
+def store(cur, user_id, key, status, body):
+    """Сохранить ответ (в той же транзакции, что и сама операция)"""
+    cur.execute("""
+        UPDATE idempotency_keys
+        SET status_code = %s, response = %s
+        WHERE user_id = %s AND key = %s
+    """, (status, Json(body), user_id, key))
+
+
+def purge_expired(cur):
+    """Удалить просроченные ключи. Возвращает их число."""
+    cur.execute("""
+        DELETE FROM idempotency_keys
+        WHERE created_at < NOW() - make_interval(hours => %s)
+    """, (_ttl_hours(),))
+    return cur.rowcount
@@ -0,0 +1,85 @@
+"""
+Разрешение ссылок на изображения товаров.
+
+В базе встречаются как полные URL (/static/uploads/products/...), так и
+голые имена файлов из старых данных и импорта. Для последних нужно знать,
+в какой папке лежит файл: список файлов static/uploads/products и
+static/media хранится в памяти и перечитывается не чаще, чем раз в
+MEDIA_MANIFEST_REFRESH_SECONDS, поэтому отрисовка страниц не обращается
+к файловой системе.
+"""
+import os
+import threading
+import time
+
+from flask import current_app
+
+NO_IMAGE = '/static/images/no-image.png'
+
+# Папки внутри static в порядке приоритета
+MEDIA_DIRS = ('uploads/products', 'media')
+
+
+class MediaManifest:
+    """Имена файлов в папках с изображениями"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files = {}
+        self.loaded_at = None
+
+    def _scan(self, static_folder):
+        files = {}
+        for folder in MEDIA_DIRS:
+            path = os.path.join(static_folder, *folder.split('/'))
+            try:
+                with os.scandir(path) as entries:
+                    files[folder] = {entry.name for entry in entries if entry.is_file()}
+            except OSError:
+                files[folder] = set()
+        return files
+
+    def refresh(self):
+        files = self._scan(current_app.static_folder)
+        with self._lock:
+            self._files = files
+            self.loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        max_age = current_app.config.get('MEDIA_MANIFEST_REFRESH_SECONDS', 300)
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > max_age:
+            self.refresh()
+
+    def add(self, folder, filename):
+        """Учесть только что сохранённый файл"""
+        with self._lock:
+            self._files.setdefault(folder, set()).add(filename)
+
+    def find(self, filename):
+        """Папка, в которой лежит файл, или None"""
+        self._ensure_loaded()
+        for folder in MEDIA_DIRS:
+            if filename in self._files.get(folder, ()):
+                return folder
+        return None
+
+    def invalidate(self):
+        self.loaded_at = None
+
+
+media_manifest = MediaManifest()
+
+
+def resolve_image_url(image):
+    """URL изображения для шаблона (заглушка, если файла нет)"""
+    if not image:
+        return NO_IMAGE
+    if image.startswith(('http://', 'https://', '/')):
+        return image
+    if image.startswith(('uploads/', 'media/')):
+        return f"/static/{image}"
+
+    folder = media_manifest.find(image)
+    if folder:
+        return f"/static/{folder}/{image}"
+    return NO_IMAGE
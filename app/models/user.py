@@ -48,13 +48,12 @@ class User(UserMixin):
         from app.database import get_db_connection
 
         conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=DictCursor)
-
-        cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-        user_data = cursor.fetchone()
-
-        cursor.close()
-        conn.close()
+        try:
+            with conn.cursor(cursor_factory=DictCursor) as cursor:
+                cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
+                user_data = cursor.fetchone()
+        finally:
+            conn.close()
 
         if user_data:
             user = cls()
@@ -0,0 +1,289 @@
+"""
+Очередь исходящих писем (transactional outbox).
+
+Письмо записывается в таблицу email_outbox тем же курсором и в той же
+транзакции, что и пользователь или заказ, поэтому оно появляется в
+очереди только вместе с ними, а запрос не ждёт SMTP-сервер. Доставляют
+письма фоновые потоки (OUTBOX_WORKERS): каждый держит одно SMTP-соединение
+и переиспользует его для всех писем. При OUTBOX_AUTOSTART потоки
+запускаются с первым запросом к приложению, а не при create_app(), поэтому
+CLI-команды их не запускают; без него письма отправляет `flask
+outbox-worker`. Вызывающий код будит их через
+outbox_worker.wake() после commit, иначе поток может не увидеть ещё не
+зафиксированное письмо и уснуть до следующего опроса. Временная ошибка
+повторяется с экспоненциальной задержкой, после OUTBOX_MAX_ATTEMPTS попыток
+письмо переходит в статус dead; постоянная (адрес отклонён, ответ 5xx) -
+сразу.
+
+Для проверки без настоящей почты достаточно локального отладочного
+сервера, например `python -m aiosmtpd -n -l localhost:1025`, и настроек
+MAIL_SERVER='localhost', MAIL_PORT=1025, MAIL_USE_TLS=False, MAIL_USERNAME=None.
+"""
+import logging
+import os
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+from email.utils import make_msgid
+
+from app.database import get_pool
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+DEAD = 'dead'
+
+# Письмо в статусе sending дольше этого времени считается брошенным
+# (поток или процесс упал во время отправки) и возвращается в очередь
+STALE_SENDING_MINUTES = 10
+
+
+def enqueue(cur, recipient, subject, html=None, text=None, kind=None):
+    """Поставить письмо в очередь (в транзакции вызывающего кода).
+
+    После commit вызывающий код должен вызвать outbox_worker.wake().
+    """
+    cur.execute("""
+        INSERT INTO email_outbox (recipient, subject, html_body, text_body, kind)
+        VALUES (%s, %s, %s, %s, %s)
+        RETURNING id
+    """, (recipient, subject, html, text, kind))
+    return cur.fetchone()[0]
+
+
+def build_message(row, sender):
+    msg = EmailMessage()
+    msg['Subject'] = row['subject']
+    msg['From'] = sender
+    msg['To'] = row['recipient']
+    msg['Message-ID'] = make_msgid()
+    msg.set_content(row['text_body'] or 'Письмо в формате HTML.')
+    if row['html_body']:
+        msg.add_alternative(row['html_body'], subtype='html')
+    return msg
+
+
+def is_permanent_error(error):
+    """Повтор не поможет: сервер отклонил все адреса или ответил кодом 5xx.
+
+    Отказ 4xx (например, greylisting 450/451) временный, его повторяем.
+    Ошибка авторизации (535) - проблема настроек, а не письма, её тоже.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return bool(codes) and all(500 <= code < 600 for code in codes)
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 500 <= error.smtp_code < 600
+    return False
+
+
+def backoff_seconds(attempts, base, limit):
+    """Задержка перед следующей попыткой: base, 2*base, 4*base, ... до limit"""
+    return min(base * (2 ** max(attempts - 1, 0)), limit)
+
+
+class SMTPConnection:
+    """Постоянное SMTP-соединение с переподключением при обрыве"""
+
+    def __init__(self, config):
+        self.host = config.get('MAIL_SERVER') or 'localhost'
+        self.port = config.get('MAIL_PORT', 25)
+        self.use_tls = config.get('MAIL_USE_TLS', False)
+        self.use_ssl = config.get('MAIL_USE_SSL', False)
+        self.username = config.get('MAIL_USERNAME')
+        self.password = config.get('MAIL_PASSWORD')
+        self.timeout = config.get('MAIL_TIMEOUT', 30)
+        self.idle_check = config.get('OUTBOX_SMTP_IDLE_CHECK_SECONDS', 30)
+        self._smtp = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        smtp = smtp_class(self.host, self.port, timeout=self.timeout)
+        if self.use_tls and not self.use_ssl:
+            smtp.starttls()
+        if self.username and self.password:
+            smtp.login(self.username, self.password)
+        return smtp
+
+    def _ensure(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > self.idle_check:
+            # Сервер мог закрыть простаивающее соединение
+            try:
+                if self._smtp.noop()[0] != 250:
+                    self.close()
+            except smtplib.SMTPException:
+                self.close()
+            except OSError:
+                self.close()
+        if self._smtp is None:
+            self._smtp = self._connect()
+        return self._smtp
+
+    def send(self, msg):
+        try:
+            self._ensure().send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # Одна повторная попытка на свежем соединении
+            self.close()
+            self._ensure().send_message(msg)
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+
+class OutboxWorker:
+    """Пул фоновых потоков доставки писем"""
+
+    def __init__(self):
+        self.app = None
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['outbox_worker'] = self
+        # Потоки запускаются только там, где обрабатываются запросы или пишутся
+        # письма, а не в CLI-командах, shell и тестах
+        app.before_request(self._autostart)
+
+    def _autostart(self):
+        if self.app.config.get('OUTBOX_AUTOSTART', True):
+            self.start()
+
+    def wake(self):
+        """Разбудить потоки (после commit письма) и запустить их при необходимости"""
+        if self.app is not None:
+            self._autostart()
+        self._wake.set()
+
+    def start(self, workers=None):
+        if self._pid == os.getpid() and self._threads:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._threads:
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            count = workers or self.app.config.get('OUTBOX_WORKERS', 2)
+            self._threads = [
+                threading.Thread(target=self._run, name=f'outbox-{i}', daemon=True)
+                for i in range(count)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        config = self.app.config
+        poll = config.get('OUTBOX_POLL_SECONDS', 5)
+        smtp = SMTPConnection(config)
+        try:
+            while not self._stop.is_set():
+                try:
+                    delivered = deliver_batch(self.app, smtp)
+                except Exception as e:
+                    logger.warning('Ошибка обработки очереди писем: %s', e)
+                    delivered = 0
+                if not delivered:
+                    self._wake.wait(poll)
+                    self._wake.clear()
+        finally:
+            smtp.close()
+
+    def _reset_after_fork(self):
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+
+outbox_worker = OutboxWorker()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=outbox_worker._reset_after_fork)
+
+
+def _claim(conn, limit):
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE email_outbox
+            SET status = %s, attempts = attempts + 1, locked_at = NOW()
+            WHERE id IN (
+                SELECT id FROM email_outbox
+                WHERE (status = %s AND next_attempt_at <= NOW())
+                   OR (status = %s AND locked_at < NOW() - make_interval(mins => %s))
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, recipient, subject, html_body, text_body, attempts
+        """, (SENDING, PENDING, SENDING, STALE_SENDING_MINUTES, limit))
+        columns = [c.name for c in cur.description]
+        rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+    conn.commit()
+    return rows
+
+
+def deliver_batch(app, smtp, limit=None):
+    """Отправить одну порцию писем. Возвращает число обработанных писем."""
+    config = app.config
+    limit = limit or config.get('OUTBOX_BATCH_SIZE', 20)
+    max_attempts = config.get('OUTBOX_MAX_ATTEMPTS', 8)
+    base = config.get('OUTBOX_RETRY_BASE_SECONDS', 30)
+    limit_delay = config.get('OUTBOX_RETRY_MAX_SECONDS', 3600)
+    sender = config.get('MAIL_DEFAULT_SENDER') or config.get('MAIL_USERNAME')
+
+    pool = get_pool(app)
+    conn = pool.getconn()
+    try:
+        rows = _claim(conn, limit)
+        for row in rows:
+            try:
+                smtp.send(build_message(row, sender))
+            except Exception as e:
+                smtp.close()
+                permanent = is_permanent_error(e)
+                status = DEAD if permanent or row['attempts'] >= max_attempts else PENDING
+                delay = backoff_seconds(row['attempts'], base, limit_delay)
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE email_outbox
+                        SET status = %s, last_error = %s, locked_at = NULL,
+                            next_attempt_at = NOW() + make_interval(secs => %s)
+                        WHERE id = %s
+                    """, (status, str(e)[:1000], delay, row['id']))
+                logger.warning('Письмо %s на %s не отправлено (попытка %s): %s',
+                               row['id'], row['recipient'], row['attempts'], e)
+            else:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE email_outbox
+                        SET status = %s, sent_at = NOW(), locked_at = NULL, last_error = NULL
+                        WHERE id = %s
+                    """, (SENT, row['id']))
+            conn.commit()
+        return len(rows)
+    finally:
+        pool.putconn(conn)
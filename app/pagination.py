@@ -0,0 +1,60 @@
+"""
+Постраничный вывод с LIMIT/OFFSET на стороне PostgreSQL
+"""
+
+
+class Pagination:
+    """Страница результатов (интерфейс совместим с includes/paginator.html)"""
+
+    def __init__(self, items, page, per_page, total):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.pages = (total + per_page - 1) // per_page if per_page > 0 else 1
+        self.has_next = page < self.pages
+        self.has_prev = page > 1
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def paginate(cur, sql, params, page, per_page, order_by):
+    """Выполнить запрос постранично за один запрос к БД.
+
+    sql - запрос без ORDER BY/LIMIT, order_by - сортировка по столбцам
+    результата (например, "q.created_at DESC, q.id DESC"). Общее число
+    строк считается оконной функцией в том же запросе.
+    """
+    page = max(page or 1, 1)
+    offset = (page - 1) * per_page
+
+    cur.execute(f"""
+        SELECT q.*, COUNT(*) OVER () AS total_count
+        FROM ({sql}) q
+        ORDER BY {order_by}
+        LIMIT %s OFFSET %s
+    """, [*params, per_page, offset])
+    items = cur.fetchall()
+
+    if items:
+        total = items[0]['total_count']
+    elif page > 1:
+        # Страница за пределами результата - общее число нужно отдельно
+        cur.execute(f"SELECT COUNT(*) AS total_count FROM ({sql}) q", list(params))
+        total = cur.fetchone()['total_count']
+    else:
+        total = 0
+
+    return Pagination(items, page, per_page, total)
@@ -0,0 +1,135 @@
+"""
+Кеш справочников (категории и бренды) в памяти процесса.
+
+Справочники меняются редко, поэтому загружаются целиком и хранятся с
+индексами по id, slug и названию в нижнем регистре. Изменения из админки
+и импорта увеличивают версию кеша (invalidate), и при следующем обращении
+данные перечитываются. Изменения, сделанные другими процессами,
+подхватываются не позже чем через REFERENCE_CACHE_SECONDS.
+
+Возвращаемые строки общие для всех запросов - их нельзя изменять.
+"""
+import threading
+import time
+
+from flask import current_app
+
+
+class ReferenceSnapshot:
+    """Загруженная версия справочников с индексами"""
+
+    def __init__(self, categories, brands, version):
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+        self.categories = categories
+        self.categories_by_id = {row['id']: row for row in categories}
+        self.categories_by_slug = {row['slug']: row for row in categories if row.get('slug')}
+        self.categories_by_name = {row['name'].lower(): row for row in categories if row.get('name')}
+
+        self.brands = brands
+        self.brands_by_id = {row['id']: row for row in brands}
+        self.brands_by_name = {row['name'].lower(): row for row in brands if row.get('name')}
+
+
+class ReferenceCache:
+    """Версионируемый кеш категорий и брендов"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.invalidations = 0
+
+    def invalidate(self):
+        """Сбросить кеш после изменения категорий или брендов"""
+        with self._lock:
+            self.version += 1
+            self.invalidations += 1
+
+    def _is_fresh(self, snapshot, max_age):
+        return (snapshot is not None
+                and snapshot.version == self.version
+                and time.monotonic() - snapshot.loaded_at <= max_age)
+
+    def snapshot(self, cur):
+        """Актуальная версия справочников (загружается при необходимости)"""
+        max_age = current_app.config.get('REFERENCE_CACHE_SECONDS', 300)
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot, max_age):
+            self.hits += 1
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if self._is_fresh(snapshot, max_age):
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+            # Версия фиксируется до чтения: если кеш сбросят во время
+            # загрузки, этот снимок сразу окажется устаревшим
+            version = self.version
+
+        cur.execute("SELECT * FROM categories ORDER BY name")
+        categories = [dict(row) for row in cur.fetchall()]
+        cur.execute("SELECT * FROM shop_brand ORDER BY name")
+        brands = [dict(row) for row in cur.fetchall()]
+
+        snapshot = ReferenceSnapshot(categories, brands, version)
+        with self._lock:
+            self._snapshot = snapshot
+            self.loads += 1
+        return snapshot
+
+    def categories(self, cur, published_only=False):
+        categories = self.snapshot(cur).categories
+        if published_only:
+            return [row for row in categories if row.get('is_published')]
+        return categories
+
+    def brands(self, cur, published_only=False):
+        brands = self.snapshot(cur).brands
+        if published_only:
+            return [row for row in brands if row.get('is_published')]
+        return brands
+
+    def category(self, cur, category_id=None, slug=None, name=None):
+        """Категория по id, slug или названию (без учёта регистра)"""
+        snapshot = self.snapshot(cur)
+        if category_id is not None:
+            return snapshot.categories_by_id.get(category_id)
+        if slug is not None:
+            return snapshot.categories_by_slug.get(slug)
+        if name is not None:
+            return snapshot.categories_by_name.get(name.strip().lower())
+        return None
+
+    def brand(self, cur, brand_id=None, name=None):
+        """Бренд по id или названию (без учёта регистра)"""
+        snapshot = self.snapshot(cur)
+        if brand_id is not None:
+            return snapshot.brands_by_id.get(brand_id)
+        if name is not None:
+            return snapshot.brands_by_name.get(name.strip().lower())
+        return None
+
+    def stats(self):
+        """Статистика кеша: попадания, промахи, загрузки, версия"""
+        total = self.hits + self.misses
+        snapshot = self._snapshot
+        return {
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else None,
+            'loads': self.loads,
+            'invalidations': self.invalidations,
+            'categories': len(snapshot.categories) if snapshot else 0,
+            'brands': len(snapshot.brands) if snapshot else 0,
+        }
+
+
+reference_cache = ReferenceCache()
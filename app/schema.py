@@ -0,0 +1,248 @@
+"""
+Изменения схемы базы данных.
+
+Каждая миграция - именованный набор SQL-команд. Применённые миграции
+записываются в таблицу schema_migrations, поэтому повторный запуск
+`flask upgrade-db` выполняет только новые.
+"""
+from app.database import get_db_connection
+
+MIGRATIONS = [
+    ('0001_products_keyset_index', """
+        -- Курсор каталога - (created_at, id): NULL не попадает в сравнение строк
+        UPDATE products SET created_at = NOW() WHERE created_at IS NULL;
+        ALTER TABLE products
+            ALTER COLUMN created_at SET DEFAULT NOW(),
+            ALTER COLUMN created_at SET NOT NULL;
+
+        CREATE INDEX IF NOT EXISTS idx_products_published_created
+            ON products (created_at DESC, id DESC)
+            WHERE is_published = TRUE;
+    """),
+    ('0002_products_full_text_search', """
+        ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(sku, '')), 'A') ||
+                setweight(to_tsvector('russian', coalesce(description, '')), 'B')
+            ) STORED;
+
+        CREATE INDEX IF NOT EXISTS idx_products_search_vector
+            ON products USING GIN (search_vector);
+
+        CREATE INDEX IF NOT EXISTS idx_products_sku_lower
+            ON products (lower(sku));
+    """),
+    ('0003_trigram_search', """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+        CREATE INDEX IF NOT EXISTS idx_products_name_trgm
+            ON products USING GIN (name gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_shop_brand_name_trgm
+            ON shop_brand USING GIN (name gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_categories_name_trgm
+            ON categories USING GIN (name gin_trgm_ops);
+    """),
+    ('0004_products_views', """
+        ALTER TABLE products ADD COLUMN IF NOT EXISTS views INTEGER DEFAULT 0;
+    """),
+    ('0005_products_main_image_url', """
+        ALTER TABLE products ADD COLUMN IF NOT EXISTS main_image_url TEXT;
+
+        -- Главное фото товара (или первое по порядку, если главное не отмечено)
+        CREATE OR REPLACE FUNCTION refresh_product_main_image(pid INTEGER)
+        RETURNS VOID AS $$
+            UPDATE products
+            SET main_image_url = (
+                SELECT image_url FROM product_images
+                WHERE product_id = pid
+                ORDER BY is_main DESC, sort_order
+                LIMIT 1
+            )
+            WHERE id = pid;
+        $$ LANGUAGE sql;
+
+        CREATE OR REPLACE FUNCTION product_images_sync_main()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM refresh_product_main_image(OLD.product_id);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.product_id IS DISTINCT FROM OLD.product_id THEN
+                PERFORM refresh_product_main_image(NEW.product_id);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS trg_product_images_sync_main ON product_images;
+        CREATE TRIGGER trg_product_images_sync_main
+            AFTER INSERT OR UPDATE OR DELETE ON product_images
+            FOR EACH ROW EXECUTE FUNCTION product_images_sync_main();
+
+        UPDATE products p
+        SET main_image_url = (
+            SELECT image_url FROM product_images
+            WHERE product_id = p.id
+            ORDER BY is_main DESC, sort_order
+            LIMIT 1
+        );
+    """),
+    ('0006_cart_items_unique_line', """
+        -- Слить дубли строк корзины (до 10 шт.) перед созданием уникального ключа
+        WITH lines AS (
+            SELECT id,
+                   SUM(quantity) OVER (PARTITION BY user_id, product_id, COALESCE(size, '')) AS total,
+                   ROW_NUMBER() OVER (PARTITION BY user_id, product_id, COALESCE(size, '')
+                                      ORDER BY added_at, id) AS rn
+            FROM cart_items
+        )
+        UPDATE cart_items ci
+        SET quantity = LEAST(l.total, 10)
+        FROM lines l
+        WHERE ci.id = l.id AND l.rn = 1 AND ci.quantity <> LEAST(l.total, 10);
+
+        DELETE FROM cart_items ci
+        USING (
+            SELECT id,
+                   ROW_NUMBER() OVER (PARTITION BY user_id, product_id, COALESCE(size, '')
+                                      ORDER BY added_at, id) AS rn
+            FROM cart_items
+        ) l
+        WHERE ci.id = l.id AND l.rn > 1;
+
+        -- Товар без размера хранится с size IS NULL, поэтому ключ по COALESCE
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_cart_items_line
+            ON cart_items (user_id, product_id, (COALESCE(size, '')));
+    """),
+    ('0007_order_number_sequence', """
+        CREATE SEQUENCE IF NOT EXISTS order_number_seq;
+
+        -- ORD-ГГГГММДД-NNNNNNNN: дата для человека, номер из последовательности
+        -- обеспечивает уникальность и возрастание при любом числе серверов
+        CREATE OR REPLACE FUNCTION next_order_number()
+        RETURNS TEXT AS $$
+            SELECT 'ORD-' || to_char(NOW(), 'YYYYMMDD') || '-'
+                   || lpad(n::text, GREATEST(length(n::text), 8), '0')
+            FROM (SELECT nextval('order_number_seq') AS n) seq;
+        $$ LANGUAGE sql;
+
+        ALTER TABLE orders ALTER COLUMN order_number SET DEFAULT next_order_number();
+
+        CREATE INDEX IF NOT EXISTS idx_orders_order_number ON orders (order_number);
+    """),
+    ('0008_idempotency_keys', """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            user_id INTEGER NOT NULL,
+            key VARCHAR(255) NOT NULL,
+            request_hash VARCHAR(64) NOT NULL,
+            status_code INTEGER,
+            response JSONB,
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (user_id, key)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created
+            ON idempotency_keys (created_at);
+    """),
+    ('0009_email_outbox', """
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            recipient VARCHAR(255) NOT NULL,
+            subject VARCHAR(500) NOT NULL,
+            html_body TEXT,
+            text_body TEXT,
+            kind VARCHAR(50),
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            locked_at TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            sent_at TIMESTAMP
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_email_outbox_due
+            ON email_outbox (next_attempt_at, id)
+            WHERE status IN ('pending', 'sending');
+    """),
+    ('0010_bulk_mail', """
+        CREATE TABLE IF NOT EXISTS bulk_mail_campaigns (
+            name VARCHAR(100) PRIMARY KEY,
+            template VARCHAR(255) NOT NULL,
+            subject VARCHAR(500) NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            finished_at TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS bulk_mail_deliveries (
+            campaign VARCHAR(100) NOT NULL REFERENCES bulk_mail_campaigns (name) ON DELETE CASCADE,
+            user_id INTEGER NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            error TEXT,
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (campaign, user_id)
+        );
+    """),
+    ('0011_products_brand_category_indexes', """
+        -- Ветки поиска brand_id = ANY(...) / category_id = ANY(...) в BitmapOr
+        CREATE INDEX IF NOT EXISTS idx_products_brand_id ON products (brand_id);
+        CREATE INDEX IF NOT EXISTS idx_products_category_id ON products (category_id);
+    """),
+    ('0012_orders_customer_contacts', """
+        -- Контакты, указанные при оформлении (для чека), а не из профиля
+        ALTER TABLE orders ADD COLUMN IF NOT EXISTS customer_name VARCHAR(255);
+        ALTER TABLE orders ADD COLUMN IF NOT EXISTS customer_phone VARCHAR(50);
+        ALTER TABLE orders ADD COLUMN IF NOT EXISTS customer_email VARCHAR(255);
+    """),
+    ('0013_products_created_at_not_null', """
+        -- То же, что в 0001, для баз, где 0001 применена раньше
+        UPDATE products SET created_at = NOW() WHERE created_at IS NULL;
+        ALTER TABLE products
+            ALTER COLUMN created_at SET DEFAULT NOW(),
+            ALTER COLUMN created_at SET NOT NULL;
+    """),
+    ('0014_reviews_created_at_not_null', """
+        -- Отзывы листаются курсором (created_at, id), как каталог
+        UPDATE reviews SET created_at = NOW() WHERE created_at IS NULL;
+        ALTER TABLE reviews
+            ALTER COLUMN created_at SET DEFAULT NOW(),
+            ALTER COLUMN created_at SET NOT NULL;
+    """),
+]
+
+
+def apply_migrations():
+    """Применить ещё не выполненные миграции. Возвращает их имена."""
+    conn = get_db_connection()
+    applied = []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    name VARCHAR(200) PRIMARY KEY,
+                    applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+                )
+            """)
+            cur.execute("SELECT name FROM schema_migrations")
+            done = {row[0] for row in cur.fetchall()}
+        conn.commit()
+
+        for name, sql in MIGRATIONS:
+            if name in done:
+                continue
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                cur.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+            conn.commit()
+            applied.append(name)
+
+        return applied
+
+    except Exception:
+        conn.rollback()
+        raise
+
+    finally:
+        conn.close()
@@ -0,0 +1,97 @@
+"""
+Поиск товаров: полнотекстовый (tsvector + GIN) и нечёткий по триграммам
+(pg_trgm) для запросов с опечатками
+"""
+from collections import namedtuple
+
+# Запрос разбирается и русской морфологией, и без неё (бренды, модели, артикулы)
+TS_QUERY = "(websearch_to_tsquery('russian', %s) || websearch_to_tsquery('simple', %s))"
+
+SearchClause = namedtuple('SearchClause', ['condition', 'params', 'rank', 'rank_params'])
+
+
+def has_sku_match(cur, search_query):
+    """Есть ли товар с точно таким артикулом"""
+    if not search_query or any(ch.isspace() for ch in search_query):
+        return False
+    cur.execute("""
+        SELECT EXISTS (SELECT 1 FROM products WHERE lower(sku) = lower(%s))
+    """, (search_query,))
+    return bool(cur.fetchone()[0])
+
+
+def product_search(cur, search_query, alias='p'):
+    """Условие поиска по товарам и выражение для сортировки по релевантности.
+
+    Точное совпадение артикула имеет приоритет: в этом случае
+    полнотекстовый поиск не выполняется.
+    """
+    if has_sku_match(cur, search_query):
+        return SearchClause(
+            condition=f"lower({alias}.sku) = lower(%s)",
+            params=[search_query],
+            rank="1.0",
+            rank_params=[]
+        )
+
+    # Нечёткое совпадение: оператор <% (word_similarity) использует
+    # GIN-индексы gin_trgm_ops. Подходящие бренды и категории находятся
+    # заранее: подзапрос IN (...) внутри OR не даёт планировщику собрать
+    # BitmapOr, и поиск превращается в полный просмотр products.
+    cur.execute("""
+        SELECT 'brand', id FROM shop_brand WHERE %(q)s <%% name
+        UNION ALL
+        SELECT 'category', id FROM categories WHERE %(q)s <%% name
+    """, {'q': search_query})
+    matched = cur.fetchall()
+    brand_ids = [row[1] for row in matched if row[0] == 'brand']
+    category_ids = [row[1] for row in matched if row[0] == 'category']
+
+    conditions = [f"{alias}.search_vector @@ {TS_QUERY}", f"%s <%% {alias}.name"]
+    params = [search_query] * 3
+    if brand_ids:
+        conditions.append(f"{alias}.brand_id = ANY(%s)")
+        params.append(brand_ids)
+    if category_ids:
+        conditions.append(f"{alias}.category_id = ANY(%s)")
+        params.append(category_ids)
+
+    return SearchClause(
+        condition="(" + " OR ".join(conditions) + ")",
+        params=params,
+        rank=f"(ts_rank({alias}.search_vector, {TS_QUERY}) + word_similarity(%s, {alias}.name))",
+        rank_params=[search_query] * 3
+    )
+
+
+def suggest_term(cur, search_query):
+    """Ближайшее известное название для подсказки "Возможно, вы имели в виду".
+
+    Кандидаты отбираются операторами % и <%, которые обслуживаются
+    триграммными индексами, поэтому запрос не сканирует таблицы целиком.
+    """
+    if not search_query:
+        return None
+
+    cur.execute("""
+        SELECT term
+        FROM (
+            SELECT name AS term, similarity(name, %(q)s) AS score
+            FROM shop_brand
+            WHERE is_published = TRUE AND name %% %(q)s
+            UNION ALL
+            SELECT name, similarity(name, %(q)s)
+            FROM categories
+            WHERE is_published = TRUE AND name %% %(q)s
+            UNION ALL
+            SELECT name, word_similarity(%(q)s, name)
+            FROM products
+            WHERE is_published = TRUE AND %(q)s <%% name
+        ) candidates
+        WHERE lower(term) <> lower(%(q)s)
+        ORDER BY score DESC, length(term)
+        LIMIT 1
+    """, {'q': search_query})
+
+    row = cur.fetchone()
+    return row[0] if row else None
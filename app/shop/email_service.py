@@ -2,26 +2,14 @@
 Сервис отправки email
 """
 
-from flask_mail import Message
-from flask import current_app
-import traceback
+from app.outbox import enqueue
 
 
-def send_receipt_email_async(app, email_data):
-    """Асинхронная отправка email"""
-    with app.app_context():
-        try:
-            mail = current_app.extensions['mail']
+def build_receipt_email(email_data):
+    """Тема и текст письма с составом заказа"""
+    subject = f"Заказ №{email_data['order_number']} — Luxury Shoes"
 
-            msg = Message(
-                subject=f"Заказ №{email_data['order_number']} — Luxury Shoes",
-                recipients=[email_data['customer_email']],
-                sender=current_app.config['MAIL_DEFAULT_SENDER']
-            )
-
-            msg.charset = 'utf-8'
-
-            msg.body = f"""
+    body = f"""
 Заказ №{email_data['order_number']} успешно оформлен!
 
 Дата: {email_data['order_date']}
@@ -31,17 +19,18 @@ def send_receipt_email_async(app, email_data):
 Состав заказа:
 """
 
-            for item in email_data['items']:
-                msg.body += f"- {item['product_name']}"
-                if item.get('size'):
-                    msg.body += f" (Размер: {item['size']})"
-                msg.body += f": {item['quantity']} × {item['price']} = {item['subtotal']} руб.\n"
+    for item in email_data['items']:
+        body += f"- {item['product_name']}"
+        if item.get('size'):
+            body += f" (Размер: {item['size']})"
+        body += f": {item['quantity']} × {item['price']} = {item['subtotal']} руб.\n"
+
+    body += f"\nИТОГО: {email_data['total_amount']} руб.\n\nСпасибо за покупку!"
 
-            msg.body += f"\nИТОГО: {email_data['total_amount']} руб.\n\nСпасибо за покупку!"
+    return subject, body
 
-            mail.send(msg)
-            current_app.logger.info(f"Email sent to {email_data['customer_email']}")
 
-        except Exception as e:
-            current_app.logger.error(f"Error sending email: {e}")
-            traceback.print_exc()
\ No newline at end of file
+def queue_receipt_email(cur, email_data):
+    """Поставить письмо о заказе в очередь (в транзакции заказа)"""
+    subject, body = build_receipt_email(email_data)
+    return enqueue(cur, email_data['customer_email'], subject, text=body, kind='receipt')
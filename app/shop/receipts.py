@@ -0,0 +1,96 @@
+"""
+Чеки заказов.
+
+Чек не хранится в файле: он собирается из orders и order_items в момент
+скачивания, поэтому оформление заказа не пишет на диск, а чек одинаков на
+любом сервере. Заказ после оформления не меняется, так что браузер может
+кешировать ответ (ETag по номеру заказа); при совпадении ETag позиции
+заказа не загружаются.
+"""
+PAYMENT_METHODS = {
+    'card': 'Банковская карта',
+    'cash': 'Наличными при получении',
+    'online': 'Онлайн перевод',
+}
+
+
+def load_order(cur, order_number, user_id=None):
+    """Заказ для чека или None.
+
+    Если передан user_id, заказ ищется только среди заказов этого пользователя.
+    Контакты покупателя - те, что указаны при оформлении; для заказов,
+    оформленных до их сохранения, берутся из профиля.
+    """
+    cur.execute("""
+        SELECT o.id, o.order_number, o.created_at, o.total_amount,
+               o.shipping_address, o.payment_method,
+               COALESCE(o.customer_name,
+                        NULLIF(concat_ws(' ', u.first_name, u.last_name), ''),
+                        u.username) AS customer_name,
+               COALESCE(o.customer_phone, u.phone) AS customer_phone,
+               COALESCE(o.customer_email, u.email) AS customer_email
+        FROM orders o
+        LEFT JOIN users u ON u.id = o.user_id
+        WHERE o.order_number = %s
+          AND (%s IS NULL OR o.user_id = %s)
+    """, (order_number, user_id, user_id))
+    return cur.fetchone()
+
+
+def receipt_etag(order):
+    """Заказ после оформления не меняется - ETag зависит только от него"""
+    return f"receipt-{order['id']}-{order['order_number']}"
+
+
+def load_items(cur, order_id):
+    """Позиции заказа для чека"""
+    cur.execute("""
+        SELECT COALESCE(p.name, 'Товар #' || oi.product_id) AS product_name,
+               oi.size, oi.quantity, oi.price
+        FROM order_items oi
+        LEFT JOIN products p ON p.id = oi.product_id
+        WHERE oi.order_id = %s
+        ORDER BY oi.id
+    """, (order_id,))
+    return cur.fetchall()
+
+
+def iter_receipt(order, items):
+    """Текст чека по частям (для потоковой отдачи)"""
+    created_at = order['created_at'].strftime('%d.%m.%Y %H:%M:%S') if order['created_at'] else ''
+    payment = PAYMENT_METHODS.get(order['payment_method'], order['payment_method'] or 'Наличные')
+
+    yield f"""
+==================================
+            LUXURY SHOES
+==================================
+            ЧЕК О ПРОДАЖЕ
+==================================
+Дата: {created_at}
+Номер заказа: {order['order_number']}
+----------------------------------
+КЛИЕНТ:
+Имя: {order['customer_name'] or ''}
+Телефон: {order['customer_phone'] or ''}
+Email: {order['customer_email'] or ''}
+Адрес: {order['shipping_address'] or ''}
+Оплата: {payment}
+----------------------------------
+ТОВАРЫ:
+"""
+
+    for item in items:
+        price = float(item['price'] or 0)
+        line = f"\n• {item['product_name']}"
+        if item['size']:
+            line += f" (Размер: {item['size']})"
+        line += f"\n  {item['quantity']} шт. × {price:.2f} руб. = {price * item['quantity']:.2f} руб."
+        yield line
+
+    yield f"""
+----------------------------------
+ИТОГО: {float(order['total_amount'] or 0):.2f} руб.
+==================================
+Спасибо за покупку!
+==================================
+"""
@@ -3,7 +3,10 @@ from flask_login import login_required
 from . import shop_bp
 from .views import (
     index as views_index,
+    api_products,
+    api_search_suggest,
     product_detail,
+    product_reviews,
     categories_list,
     category_products as views_category_products,
     brands_list,
@@ -13,6 +16,7 @@ from .views import (
     remove_from_cart,
     clear_cart,
     cart_status,
+    api_update_cart,
     checkout,
     api_get_cart,
     api_checkout,
@@ -31,12 +35,27 @@ def index():
     return views_index()
 
 
+@shop_bp.route('/api/products')
+def api_products_route():
+    return api_products()
+
+
+@shop_bp.route('/api/search/suggest')
+def api_search_suggest_route():
+    return api_search_suggest()
+
+
 # Товары
 @shop_bp.route('/product/<int:product_id>')
 def product_detail_route(product_id):
     return product_detail(product_id)
 
 
+@shop_bp.route('/product/<int:product_id>/reviews')
+def product_reviews_route(product_id):
+    return product_reviews(product_id)
+
+
 # Категории
 @shop_bp.route('/categories')
 def categories():
@@ -88,6 +107,12 @@ def update_cart_quantity_route(item_id):
     return update_cart_quantity(item_id)
 
 
+@shop_bp.route('/api/cart/batch', methods=['POST'])
+@login_required
+def api_update_cart_route():
+    return api_update_cart()
+
+
 # Оформление заказа
 @shop_bp.route('/checkout')
 @login_required
@@ -2,14 +2,18 @@
 Инициализация представлений магазина
 """
 
-from .products import index, product_detail, categories_list, category_products, brands_list
-from .cart import cart, update_cart_quantity, add_to_cart, remove_from_cart, clear_cart, cart_status
+from .products import (index, api_products, api_search_suggest, product_detail, product_reviews,
+                       categories_list, category_products, brands_list)
+from .cart import cart, update_cart_quantity, add_to_cart, remove_from_cart, clear_cart, cart_status, api_update_cart
 from .checkout import checkout, api_checkout, order_success, download_receipt, api_get_cart
 from .reviews import add_review, edit_review, delete_review
 
 __all__ = [
     'index',
+    'api_products',
+    'api_search_suggest',
     'product_detail',
+    'product_reviews',
     'categories_list',
     'category_products',
     'brands_list',
@@ -19,6 +23,7 @@ __all__ = [
     'remove_from_cart',
     'clear_cart',
     'cart_status',
+    'api_update_cart',
     'checkout',
     'api_checkout',
     'api_get_cart',
@@ -1,27 +1,17 @@
 """
 Представления для работы с корзиной
 """
-from flask import render_template, request, jsonify, session, flash, redirect, url_for
+from flask import render_template, request, jsonify, flash, redirect, url_for
 from flask_login import current_user
-import os
+from psycopg2.extras import execute_values
 
+from app.cart_count import get_cart_count, set_cart_count, adjust_cart_count
 from app.database import get_cursor
+from app.media import resolve_image_url
+from app.stock import check_stock_batch, stock_status
 
-
-def get_cart_count():
-    """Получить количество товаров в корзине"""
-    cart_count = 0
-
-    if current_user.is_authenticated:
-        with get_cursor() as cur:
-            sql = "SELECT SUM(quantity) as total FROM cart_items WHERE user_id = %s"
-            cur.execute(sql, (current_user.id,))
-            result = cur.fetchone()
-            cart_count = result['total'] if result and result['total'] else 0
-    elif 'cart' in session:
-        cart_count = sum(session['cart'].values())
-
-    return cart_count
+# Максимальное количество одного товара (размера) в корзине
+MAX_LINE_QUANTITY = 10
 
 
 def get_cart_items(user_id=None):
@@ -49,7 +39,7 @@ def get_cart_items(user_id=None):
                 (p.stock > 0) as in_stock,
                 c.name as category_name,
                 sb.name as brand_name,
-                (SELECT image_url FROM product_images WHERE product_id = p.id AND is_main = TRUE LIMIT 1) as main_image
+                p.main_image_url as main_image
             FROM cart_items ci
             JOIN products p ON ci.product_id = p.id
             LEFT JOIN categories c ON p.category_id = c.id
@@ -65,47 +55,6 @@ def get_cart_items(user_id=None):
         return []
 
 
-def check_stock_availability(product_id, size, quantity):
-    """Проверить доступность товара на складе"""
-    try:
-        with get_cursor() as cur:
-            if size:
-                cur.execute("""
-                    SELECT ps.quantity as size_stock, p.stock as total_stock
-                    FROM product_sizes ps
-                    JOIN products p ON ps.product_id = p.id
-                    WHERE ps.product_id = %s AND ps.size = %s
-                """, (product_id, size))
-
-                result = cur.fetchone()
-
-                if not result:
-                    return False, "Размер недоступен"
-
-                if quantity > result['size_stock']:
-                    return False, f"Для размера {size} доступно только {result['size_stock']} шт."
-
-                return True, None
-            else:
-                cur.execute("""
-                    SELECT stock FROM products
-                    WHERE id = %s AND is_published = TRUE
-                """, (product_id,))
-
-                result = cur.fetchone()
-
-                if not result:
-                    return False, "Товар не найден"
-
-                if quantity > result['stock']:
-                    return False, f"Доступно только {result['stock']} шт."
-
-                return True, None
-
-    except Exception:
-        return False, "Ошибка проверки наличия"
-
-
 def cart():
     """Страница корзины"""
     try:
@@ -132,7 +81,7 @@ def cart():
                 (p.stock > 0) as in_stock,
                 c.name as category_name,
                 sb.name as brand_name,
-                (SELECT image_url FROM product_images WHERE product_id = p.id AND is_main = TRUE LIMIT 1) as main_image
+                p.main_image_url as main_image
             FROM cart_items ci
             JOIN products p ON ci.product_id = p.id
             LEFT JOIN categories c ON p.category_id = c.id
@@ -144,6 +93,11 @@ def cart():
             cur.execute(query, (user_id,))
             items = cur.fetchall()
 
+            stock = check_stock_batch(cur, [
+                (item['product_id'], item['size'], item['quantity'])
+                for item in items if item['size']
+            ])
+
             cart_items = []
             total_quantity = 0
             total_price = 0.0
@@ -156,32 +110,11 @@ def cart():
                 total_quantity += quantity
                 total_price += item_total
 
-                image = item['main_image']
-                if image:
-                    if image.startswith(('http://', 'https://', '/')):
-                        pass
-                    elif image.startswith('uploads/'):
-                        image = f"/static/{image}"
-                    elif image.startswith('media/'):
-                        image = f"/static/media/{image}"
-                    else:
-                        if os.path.exists(f"static/uploads/products/{image}"):
-                            image = f"/static/uploads/products/{image}"
-                        elif os.path.exists(f"static/media/{image}"):
-                            image = f"/static/media/{image}"
-                        else:
-                            image = "/static/images/no-image.png"
-                else:
-                    image = "/static/images/no-image.png"
+                image = resolve_image_url(item['main_image'])
 
                 size_available = True
                 if item['size']:
-                    available, _ = check_stock_availability(
-                        item['product_id'],
-                        item['size'],
-                        quantity
-                    )
-                    size_available = available
+                    size_available, _ = stock_status(stock, item['product_id'], item['size'])
 
                 cart_items.append({
                     'cart_item_id': item['cart_item_id'],
@@ -217,43 +150,54 @@ def cart():
 
 
 def update_cart_quantity(item_id):
+    """Изменить количество из формы корзины (с проверкой наличия)"""
     quantity = request.form.get('quantity', type=int)
 
-    if not quantity or quantity < 1:
+    if not quantity:
         flash('Неверное количество', 'error')
         return redirect(url_for('shop.cart_route'))
 
-    if quantity > 10:
-        flash('Максимальное количество — 10 шт.', 'error')
-        return redirect(url_for('shop.cart_route'))
-
-    try:
-        cursor = get_cursor()
-        cursor.execute("""
-            UPDATE cart_items
-            SET quantity = %s
-            WHERE id = %s AND user_id = %s
-            RETURNING quantity
-        """, (quantity, item_id, current_user.id))
-
-        updated = cursor.fetchone()
-        cursor.connection.commit()
-        cursor.close()
-
-        if updated:
-            flash('Количество обновлено', 'success')
-        else:
-            flash('Товар не найден в корзине', 'error')
+    result = update_cart_item_quantity(item_id, quantity)
+    flash(result['message'], 'success' if result['success'] else 'error')
+    return redirect(url_for('shop.cart_route'))
 
-    except Exception as e:
-        print(f"Error updating cart quantity: {e}")
-        flash('Ошибка обновления количества', 'error')
 
-    return redirect(url_for('shop.cart_route'))
+ADD_TO_CART_SQL = """
+    WITH product AS (
+        SELECT id, name
+        FROM products
+        WHERE id = %(product_id)s AND is_published = TRUE
+    ),
+    line AS (
+        INSERT INTO cart_items (user_id, product_id, size, quantity, added_at)
+        SELECT %(user_id)s, id, %(size)s, %(quantity)s, NOW()
+        FROM product
+        ON CONFLICT (user_id, product_id, (COALESCE(size, '')))
+        DO UPDATE SET quantity = cart_items.quantity + EXCLUDED.quantity
+        WHERE cart_items.quantity + EXCLUDED.quantity <= %(max_quantity)s
+        RETURNING quantity, (xmax = 0) AS inserted
+    )
+    SELECT
+        p.name,
+        l.quantity,
+        l.inserted,
+        (SELECT quantity FROM cart_items
+         WHERE user_id = %(user_id)s AND product_id = %(product_id)s
+           AND COALESCE(size, '') = COALESCE(%(size)s, '')) AS previous_quantity,
+        COALESCE((SELECT SUM(quantity) FROM cart_items WHERE user_id = %(user_id)s), 0)
+            + CASE WHEN l.quantity IS NULL THEN 0 ELSE %(quantity)s END AS cart_count
+    FROM product p
+    LEFT JOIN line l ON TRUE
+"""
 
 
 def add_to_cart(product_id):
-    """Добавление товара в корзину"""
+    """Добавление товара в корзину.
+
+    Строка корзины добавляется или увеличивается одним запросом
+    (INSERT ... ON CONFLICT DO UPDATE). Ограничение в MAX_LINE_QUANTITY шт.
+    проверяется в том же запросе, поэтому двойной клик не создаёт дублей.
+    """
     try:
         if not current_user.is_authenticated:
             return jsonify({'success': False, 'message': 'Войдите в систему'})
@@ -266,80 +210,52 @@ def add_to_cart(product_id):
                 'success': False,
                 'message': 'Количество должно быть больше 0'
                 })
-        if quantity > 10:
+        if quantity > MAX_LINE_QUANTITY:
             return jsonify({
                 'success': False,
-                'message': 'Максимальное количество - 10 шт.'
+                'message': f'Максимальное количество - {MAX_LINE_QUANTITY} шт.'
                 })
 
         with get_cursor() as cur:
-            if size:
-                cur.execute("""
-                    SELECT id, quantity
-                    FROM cart_items
-                    WHERE user_id = %s AND product_id = %s AND size = %s
-                """, (current_user.id, product_id, size))
-            else:
-                cur.execute("""
-                    SELECT id, quantity
-                    FROM cart_items
-                    WHERE user_id = %s AND product_id = %s AND size IS NULL
-                """, (current_user.id, product_id))
-
-            existing_item = cur.fetchone()
-
-            if existing_item:
-                new_quantity = existing_item['quantity'] + quantity
-                if new_quantity > 10:
-                    return jsonify({
-                        'success': False,
-                        'message': f'Максимальное количество в корзине - 10 шт. У вас уже {existing_item["quantity"]} шт.'
-                    })
-
-                cur.execute("""
-                    UPDATE cart_items
-                    SET quantity = %s
-                    WHERE id = %s
-                """, (new_quantity, existing_item['id']))
-                action = 'updated'
-            else:
-                cur.execute("""
-                    INSERT INTO cart_items (user_id, product_id, size, quantity, added_at)
-                    VALUES (%s, %s, %s, %s, NOW())
-                """, (current_user.id, product_id, size if size else None, quantity))
-                action = 'added'
-
-            cur.execute("""
-                SELECT name, price
-                FROM products
-                WHERE id = %s
-            """, (product_id,))
-
-            product = cur.fetchone()
-            product_name = product['name'] if product else "Товар"
-
-            cur.execute("""
-                SELECT SUM(quantity) as total
-                FROM cart_items
-                WHERE user_id = %s
-            """, (current_user.id,))
-
+            # Подзапросы основного SELECT видят корзину до изменения,
+            # поэтому previous_quantity - количество до добавления
+            cur.execute(ADD_TO_CART_SQL, {
+                'user_id': current_user.id,
+                'product_id': product_id,
+                'size': size or None,
+                'quantity': quantity,
+                'max_quantity': MAX_LINE_QUANTITY
+            })
             result = cur.fetchone()
-            cart_count = result['total'] or 0 if result else 0
-
             cur.connection.commit()
 
-            message_text = f'Товар "{product_name}" добавлен в корзину'
-            if action == 'updated':
-                message_text = f'Количество товара "{product_name}" обновлено'
+        if not result:
+            return jsonify({'success': False, 'message': 'Товар не найден'})
 
+        if result['quantity'] is None:
             return jsonify({
-                'success': True,
-                'message': message_text,
-                'cart_count': cart_count,
-                'action': action
+                'success': False,
+                'message': f'Максимальное количество в корзине - {MAX_LINE_QUANTITY} шт. '
+                           f'У вас уже {result["previous_quantity"]} шт.'
             })
 
+        cart_count = set_cart_count(result['cart_count'])
+        product_name = result['name'] or "Товар"
+
+        if result['inserted']:
+            action = 'added'
+            message_text = f'Товар "{product_name}" добавлен в корзину'
+        else:
+            action = 'updated'
+            message_text = f'Количество товара "{product_name}" обновлено'
+
+        return jsonify({
+            'success': True,
+            'message': message_text,
+            'cart_count': cart_count,
+            'action': action
+        })
+
     except Exception:
         return jsonify({
             'success': False,
@@ -368,10 +284,14 @@ def remove_from_cart(item_id):
                 flash('Товар не найден в корзине', 'error')
                 return redirect('/cart')
 
-            cur.execute("DELETE FROM cart_items WHERE id = %s AND user_id = %s",
-                        (item_id, current_user.id))
+            cur.execute("""
+                DELETE FROM cart_items WHERE id = %s AND user_id = %s
+                RETURNING quantity
+            """, (item_id, current_user.id))
+            deleted = cur.fetchone()
 
             cur.connection.commit()
+            adjust_cart_count(-deleted['quantity'] if deleted else 0)
 
             flash(f'Товар "{item["name"]}" удален из корзины', 'success')
             return redirect('/cart')
@@ -399,6 +319,7 @@ def clear_cart():
                     "DELETE FROM cart_items WHERE user_id = %s",
                     (current_user.id,))
                 cur.connection.commit()
+                set_cart_count(0)
 
                 flash(f'Корзина очищена ({count} товаров удалено)', 'success')
         else:
@@ -435,8 +356,8 @@ def update_cart_item_quantity(item_id, new_quantity):
         if new_quantity < 1:
             return {'success': False, 'message': 'Количество должно быть больше 0'}
 
-        if new_quantity > 10:
-            return {'success': False, 'message': 'Максимальное количество - 10 шт.'}
+        if new_quantity > MAX_LINE_QUANTITY:
+            return {'success': False, 'message': f'Максимальное количество - {MAX_LINE_QUANTITY} шт.'}
 
         with get_cursor() as cur:
             cur.execute("""
@@ -450,11 +371,8 @@ def update_cart_item_quantity(item_id, new_quantity):
             if not item:
                 return {'success': False, 'message': 'Товар не найден в корзине'}
 
-            available, message = check_stock_availability(
-                item['product_id'],
-                item['size'],
-                new_quantity
-            )
+            stock = check_stock_batch(cur, [(item['product_id'], item['size'], new_quantity)])
+            available, message = stock_status(stock, item['product_id'], item['size'])
 
             if not available:
                 return {'success': False, 'message': message}
@@ -465,7 +383,16 @@ def update_cart_item_quantity(item_id, new_quantity):
                 WHERE id = %s AND user_id = %s
             """, (new_quantity, item_id, current_user.id))
 
+            # Сумма в той же транзакции - бейдж обновляется без повторного запроса
+            cur.execute("""
+                SELECT COALESCE(SUM(quantity), 0) as cart_count
+                FROM cart_items
+                WHERE user_id = %s
+            """, (current_user.id,))
+            cart_count = cur.fetchone()['cart_count']
+
             cur.connection.commit()
+            set_cart_count(cart_count)
 
             return {
                 'success': True,
@@ -512,3 +439,183 @@ def get_cart_summary():
             'total': 0,
             'items': []
         }
+
+
+CART_OPERATIONS = ('set', 'remove', 'add')
+
+
+def _line_key(product_id, size):
+    return int(product_id), (str(size) if size else None)
+
+
+def _cart_summary(cur, user_id):
+    """Строки корзины с суммами (для ответа API)"""
+    cur.execute("""
+        SELECT ci.id as cart_item_id, ci.product_id, ci.size, ci.quantity,
+               p.name, p.price
+        FROM cart_items ci
+        JOIN products p ON ci.product_id = p.id
+        WHERE ci.user_id = %s
+        ORDER BY ci.added_at DESC
+    """, (user_id,))
+
+    items = []
+    total_quantity = 0
+    total_price = 0.0
+    for row in cur.fetchall():
+        price = float(row['price'] or 0)
+        item_total = price * row['quantity']
+        total_quantity += row['quantity']
+        total_price += item_total
+        items.append({
+            'cart_item_id': row['cart_item_id'],
+            'product_id': row['product_id'],
+            'name': row['name'],
+            'size': row['size'],
+            'quantity': row['quantity'],
+            'price': price,
+            'item_total': round(item_total, 2)
+        })
+
+    return {
+        'items': items,
+        'count': len(items),
+        'total_quantity': total_quantity,
+        'total_price': round(total_price, 2)
+    }
+
+
+def _apply_operations(lines, operations):
+    """Применить операции к строкам корзины в памяти.
+
+    lines - {(product_id, size): {'id', 'quantity'}}. Возвращает список
+    ошибок и множество затронутых строк.
+    """
+    by_id = {line['id']: key for key, line in lines.items()}
+    errors = []
+    touched = set()
+
+    for index, op in enumerate(operations):
+        kind = op.get('op') if isinstance(op, dict) else None
+        if kind not in CART_OPERATIONS:
+            errors.append({'index': index, 'message': 'Неизвестная операция'})
+            continue
+
+        if kind in ('set', 'remove'):
+            try:
+                key = by_id.get(int(op.get('item_id')))
+            except (TypeError, ValueError):
+                key = None
+            if key is None or key not in lines:
+                errors.append({'index': index, 'message': 'Товар не найден в корзине'})
+                continue
+        else:
+            try:
+                key = _line_key(op.get('product_id'), op.get('size'))
+            except (TypeError, ValueError):
+                errors.append({'index': index, 'message': 'Товар не найден'})
+                continue
+
+        if kind == 'remove':
+            del lines[key]
+            touched.discard(key)
+            continue
+
+        try:
+            quantity = int(op.get('quantity', 1))
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'message': 'Неверное количество'})
+            continue
+
+        if kind == 'add':
+            quantity += lines.get(key, {}).get('quantity', 0)
+
+        if quantity < 1:
+            errors.append({'index': index, 'message': 'Количество должно быть больше 0'})
+        elif quantity > MAX_LINE_QUANTITY:
+            errors.append({'index': index,
+                           'message': f'Максимальное количество - {MAX_LINE_QUANTITY} шт.'})
+        else:
+            lines.setdefault(key, {'id': None})['quantity'] = quantity
+            touched.add(key)
+
+    return errors, touched
+
+
+def api_update_cart():
+    """API: несколько изменений корзины одной транзакцией.
+
+    Принимает {"operations": [{"op": "set", "item_id", "quantity"},
+    {"op": "remove", "item_id"}, {"op": "add", "product_id", "size",
+    "quantity"}]}. Операции применяются по порядку; если хотя бы одна
+    не проходит проверку, корзина не меняется.
+    """
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'success': False, 'message': 'Нет операций'}), 400
+
+    user_id = current_user.id
+
+    try:
+        with get_cursor() as cur:
+            cur.execute("""
+                SELECT id, product_id, size, quantity
+                FROM cart_items
+                WHERE user_id = %s
+                FOR UPDATE
+            """, (user_id,))
+            lines = {
+                _line_key(row['product_id'], row['size']): {'id': row['id'], 'quantity': row['quantity']}
+                for row in cur.fetchall()
+            }
+            before = {key: line['id'] for key, line in lines.items()}
+
+            errors, touched = _apply_operations(lines, operations)
+
+            if not errors and touched:
+                stock = check_stock_batch(cur, [
+                    (key[0], key[1], lines[key]['quantity']) for key in touched
+                ])
+                for key in touched:
+                    available, message = stock_status(stock, *key)
+                    if not available:
+                        errors.append({'product_id': key[0], 'size': key[1], 'message': message})
+
+            if errors:
+                cur.connection.rollback()
+                return jsonify({
+                    'success': False,
+                    'message': 'Корзина не изменена',
+                    'errors': errors
+                }), 409
+
+            removed = [before[key] for key in set(before) - set(lines)]
+            if removed:
+                cur.execute("""
+                    DELETE FROM cart_items
+                    WHERE user_id = %s AND id = ANY(%s)
+                """, (user_id, removed))
+
+            if touched:
+                execute_values(cur, """
+                    INSERT INTO cart_items (user_id, product_id, size, quantity, added_at)
+                    VALUES %s
+                    ON CONFLICT (user_id, product_id, (COALESCE(size, '')))
+                    DO UPDATE SET quantity = EXCLUDED.quantity
+                """, [(user_id, key[0], key[1], lines[key]['quantity']) for key in touched],
+                    template="(%s, %s, %s, %s, NOW())")
+
+            summary = _cart_summary(cur, user_id)
+            cur.connection.commit()
+
+        set_cart_count(summary['total_quantity'])
+
+        return jsonify({
+            'success': True,
+            'message': 'Корзина обновлена',
+            **summary
+        })
+
+    except Exception:
+        return jsonify({'success': False, 'message': 'Ошибка обновления корзины'}), 500
@@ -1,12 +1,17 @@
 """
 Представления для оформления заказа
 """
-from flask import render_template, request, jsonify, send_file, current_app, flash, redirect, url_for
+from flask import render_template, request, jsonify, flash, redirect, url_for, Response
 from flask_login import current_user, login_required
-import os
+from psycopg2.extras import execute_values
 from datetime import datetime
 
+from app import idempotency
+from app.cart_count import set_cart_count
 from app.database import get_cursor
+from app.outbox import outbox_worker
+from app.shop.email_service import queue_receipt_email
+from app.shop.receipts import iter_receipt, load_items, load_order, receipt_etag
 
 
 def checkout():
@@ -26,12 +31,13 @@ def checkout():
                     p.name as product_name,
                     p.price,
                     p.description,
-                    pi.image_url as product_image,
-                    (SELECT name FROM categories WHERE id = p.category_id) as category_name,
-                    (SELECT name FROM shop_brand WHERE id = p.brand_id) as brand_name
+                    p.main_image_url as product_image,
+                    c.name as category_name,
+                    b.name as brand_name
                 FROM cart_items ci
                 JOIN products p ON ci.product_id = p.id
-                LEFT JOIN product_images pi ON p.id = pi.product_id AND pi.is_main = TRUE
+                LEFT JOIN categories c ON p.category_id = c.id
+                LEFT JOIN shop_brand b ON p.brand_id = b.id
                 WHERE ci.user_id = %s
             """, (current_user.id,))
 
@@ -67,8 +73,105 @@ def checkout():
         return redirect(url_for('shop.cart_route'))
 
 
+RESERVE_STOCK_SQL = """
+    WITH req AS (
+        SELECT * FROM unnest(%s::int[], %s::text[], %s::int[]) AS r(product_id, size, qty)
+    ),
+    prod AS (
+        SELECT product_id, SUM(qty) AS qty FROM req GROUP BY product_id
+    ),
+    locked AS (
+        -- Блокировки в порядке id, чтобы параллельные заказы не взаимоблокировались
+        SELECT id FROM products
+        WHERE id IN (SELECT product_id FROM prod)
+        ORDER BY id
+        FOR UPDATE
+    ),
+    upd_products AS (
+        UPDATE products p
+        SET stock = p.stock - prod.qty
+        FROM prod
+        WHERE p.id = prod.product_id
+          AND p.id IN (SELECT id FROM locked)
+          AND p.is_published = TRUE
+          AND p.stock >= prod.qty
+        RETURNING p.id
+    ),
+    upd_sizes AS (
+        UPDATE product_sizes ps
+        SET quantity = ps.quantity - req.qty
+        FROM req
+        WHERE req.size IS NOT NULL
+          AND ps.product_id = req.product_id
+          AND ps.size::text = req.size
+          AND ps.quantity >= req.qty
+        RETURNING ps.product_id, ps.size::text AS size
+    )
+    SELECT
+        req.product_id, req.size, req.qty,
+        p.stock, ps.quantity as size_stock,
+        EXISTS (SELECT 1 FROM upd_products u WHERE u.id = req.product_id) as product_ok,
+        (req.size IS NULL OR EXISTS (
+            SELECT 1 FROM upd_sizes u
+            WHERE u.product_id = req.product_id AND u.size = req.size
+        )) as size_ok
+    FROM req
+    LEFT JOIN products p ON p.id = req.product_id
+    LEFT JOIN product_sizes ps ON ps.product_id = req.product_id AND ps.size::text = req.size
+"""
+
+
+def _reserve_stock(cur, cart_items):
+    """Списать остатки по всем строкам заказа одним запросом.
+
+    Списание условное (остаток >= количества) на уровне товара и размера.
+    Возвращает список конфликтов; если он не пуст, транзакцию нужно
+    откатить.
+    """
+    names = {item['product_id']: item['product_name'] for item in cart_items}
+    cur.execute(RESERVE_STOCK_SQL, (
+        [item['product_id'] for item in cart_items],
+        [str(item['size']) if item['size'] else None for item in cart_items],
+        [item['quantity'] for item in cart_items]
+    ))
+
+    conflicts = []
+    for row in cur.fetchall():
+        if row['product_ok'] and row['size_ok']:
+            continue
+
+        if row['stock'] is None:
+            available, message = 0, "Товар не найден"
+        elif not row['size_ok']:
+            available = row['size_stock'] or 0
+            message = (f"Для размера {row['size']} доступно только {available} шт."
+                       if row['size_stock'] is not None else "Размер недоступен")
+        else:
+            available = row['stock']
+            message = f"Доступно только {available} шт."
+
+        conflicts.append({
+            'product_id': row['product_id'],
+            'size': row['size'],
+            'requested': row['qty'],
+            'available': available,
+            'message': f"{names.get(row['product_id'], 'Товар')}: {message}"
+        })
+
+    return conflicts
+
+
 def api_checkout():
-    """API для обработки заказа"""
+    """API для обработки заказа.
+
+    Всё выполняется одной транзакцией: строки корзины блокируются,
+    остатки списываются одним запросом, позиции заказа вставляются
+    одним многострочным INSERT. При нехватке товара изменения
+    откатываются, а в ответе перечислены конфликтующие строки.
+
+    С заголовком Idempotency-Key повтор запроса возвращает ответ первого,
+    а не создаёт второй заказ.
+    """
     try:
         if not current_user.is_authenticated:
             return jsonify({'success': False, 'message': 'Войдите в систему'}), 401
@@ -77,7 +180,25 @@ def api_checkout():
         if not data:
             return jsonify({'success': False, 'message': 'Нет данных'}), 400
 
+        idempotency_key = request.headers.get(idempotency.HEADER)
+
         with get_cursor() as cur:
+            if idempotency_key:
+                try:
+                    replay = idempotency.claim(cur, current_user.id, idempotency_key,
+                                               idempotency.fingerprint(data))
+                except idempotency.IdempotencyConflict as e:
+                    cur.connection.rollback()
+                    return jsonify({'success': False, 'message': e.message}), e.status
+
+                if replay:
+                    cur.connection.rollback()
+                    status, body = replay
+                    response = jsonify(body)
+                    response.status_code = status
+                    response.headers['Idempotent-Replayed'] = 'true'
+                    return response
+
             cur.execute("""
                 SELECT
                     ci.id as cart_item_id,
@@ -87,19 +208,29 @@ def api_checkout():
                     p.name as product_name,
                     p.price,
                     p.description,
-                    pi.image_url as product_image
+                    p.main_image_url as product_image
                 FROM cart_items ci
                 JOIN products p ON ci.product_id = p.id
-                LEFT JOIN product_images pi ON p.id = pi.product_id AND pi.is_main = TRUE
                 WHERE ci.user_id = %s
+                ORDER BY ci.id
+                FOR UPDATE OF ci
             """, (current_user.id,))
 
             cart_items = cur.fetchall()
 
             if not cart_items:
+                cur.connection.rollback()
                 return jsonify({'success': False, 'message': 'Корзина пуста'}), 400
 
-            order_number = f"ORD-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            conflicts = _reserve_stock(cur, cart_items)
+            if conflicts:
+                cur.connection.rollback()
+                return jsonify({
+                    'success': False,
+                    'message': 'Некоторых товаров нет в нужном количестве',
+                    'unavailable': conflicts
+                }), 409
+
             order_date = datetime.now()
 
             total_amount = 0
@@ -121,17 +252,20 @@ def api_checkout():
                     'image_url': item['product_image']
                 })
 
+            # Точка сохранения: при старой схеме orders без части колонок
+            # повторяем вставку с минимальным набором полей
+            cur.execute("SAVEPOINT order_insert")
             try:
                 cur.execute("""
                     INSERT INTO orders (
                         user_id, order_number, total_amount, status,
                         shipping_address, payment_method, payment_status, notes,
-                        billing_address, created_at
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    RETURNING id
+                        billing_address, customer_name, customer_phone,
+                        customer_email, created_at
+                    ) VALUES (%s, next_order_number(), %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id, order_number
                 """, (
                     current_user.id,
-                    order_number,
                     total_amount,
                     'processing',
                     data.get('address', ''),
@@ -139,97 +273,64 @@ def api_checkout():
                     'pending',
                     data.get('comment', ''),
                     data.get('address', ''),
+                    data.get('fullName') or None,
+                    data.get('phone') or None,
+                    data.get('email') or None,
                     order_date
                 ))
 
-                result = cur.fetchone()
-                order_id = result['id'] if result else 0
-
             except Exception:
+                cur.execute("ROLLBACK TO SAVEPOINT order_insert")
                 cur.execute("""
                     INSERT INTO orders (user_id, order_number, total_amount)
-                    VALUES (%s, %s, %s)
-                    RETURNING id
-                """, (current_user.id, order_number, total_amount))
-
-                result = cur.fetchone()
-                order_id = result['id'] if result else 0
-
-            for item in order_items:
-                try:
-                    cur.execute("""
-                        INSERT INTO order_items (order_id, product_id, size, quantity, price)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """, (
-                        order_id,
-                        item['product_id'],
-                        item['size'],
-                        item['quantity'],
-                        item['price']
-                    ))
-                except Exception:
-                    pass
-
-                cur.execute("""
-                    UPDATE products
-                    SET stock = stock - %s
-                    WHERE id = %s AND stock >= %s
-                """, (item['quantity'], item['product_id'], item['quantity']))
+                    VALUES (%s, next_order_number(), %s)
+                    RETURNING id, order_number
+                """, (current_user.id, total_amount))
+
+            order = cur.fetchone()
+            order_id = order['id']
+            order_number = order['order_number']
+
+            execute_values(cur, """
+                INSERT INTO order_items (order_id, product_id, size, quantity, price)
+                VALUES %s
+            """, [
+                (order_id, item['product_id'], item['size'], item['quantity'], item['price'])
+                for item in order_items
+            ])
 
             cur.execute("DELETE FROM cart_items WHERE user_id = %s", (current_user.id,))
 
-            cur.connection.commit()
-
-        receipts_dir = os.path.join(current_app.root_path, 'static', 'receipts')
-        os.makedirs(receipts_dir, exist_ok=True)
-
-        receipt_content = f"""
-==================================
-            LUXURY SHOES
-==================================
-            ЧЕК О ПРОДАЖЕ
-==================================
-Дата: {order_date.strftime('%d.%m.%Y %H:%M:%S')}
-Номер заказа: {order_number}
-----------------------------------
-КЛИЕНТ:
-Имя: {data.get('fullName', '')}
-Телефон: {data.get('phone', '')}
-Email: {data.get('email', '')}
-Адрес: {data.get('address', '')}
-Оплата: {data.get('paymentMethod', 'Наличные')}
-----------------------------------
-ТОВАРЫ:
-"""
-
-        for item in order_items:
-            receipt_content += f"\n• {item['product_name']}"
-            if item['size']:
-                receipt_content += f" (Размер: {item['size']})"
-            receipt_content += f"\n  {item['quantity']} шт. × {item['price']:.2f} руб. = {item['subtotal']:.2f} руб."
-
-        receipt_content += f"""
-----------------------------------
-ИТОГО: {total_amount:.2f} руб.
-==================================
-Спасибо за покупку!
-==================================
-"""
+            result = {
+                'success': True,
+                'message': 'Заказ оформлен успешно!',
+                'order_number': order_number,
+                'order_id': order_id,
+                'total_amount': total_amount,
+                'receipt_url': url_for('shop.download_receipt_route', order_number=order_number)
+            }
+
+            customer_email = data.get('email') or current_user.email
+            if customer_email:
+                queue_receipt_email(cur, {
+                    'order_number': order_number,
+                    'customer_email': customer_email,
+                    'order_date': order_date.strftime('%d.%m.%Y %H:%M'),
+                    'payment_method': data.get('paymentMethod', 'cash'),
+                    'delivery_address': data.get('address', ''),
+                    'items': order_items,
+                    'total_amount': round(total_amount, 2)
+                })
 
-        filename = f"receipt_{order_number}.txt"
-        filepath = os.path.join(receipts_dir, filename)
+            if idempotency_key:
+                idempotency.store(cur, current_user.id, idempotency_key, 200, result)
 
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(receipt_content)
+            cur.connection.commit()
+            if customer_email:
+                outbox_worker.wake()
+            set_cart_count(0)
 
-        return jsonify({
-            'success': True,
-            'message': 'Заказ оформлен успешно!',
-            'order_number': order_number,
-            'order_id': order_id,
-            'total_amount': total_amount,
-            'receipt_url': f'/static/receipts/{filename}'
-        })
+        return jsonify(result)
 
     except Exception:
         return jsonify({
@@ -248,21 +349,33 @@ def order_success(order_number):
 
 @login_required
 def download_receipt(order_number):
-    """Скачивание чека"""
+    """Скачивание чека (только своего заказа; администратор - любого)"""
     try:
-        filename = f"receipt_{order_number}.txt"
-        filepath = os.path.join(current_app.root_path, 'static', 'receipts', filename)
-
-        if os.path.exists(filepath):
-            return send_file(
-                filepath,
-                as_attachment=True,
-                download_name=filename,
-                mimetype='text/plain'
-            )
-        else:
-            flash('Чек не найден', 'error')
-            return redirect(url_for('shop.cart_route'))
+        owner_id = None if current_user.is_staff else current_user.id
+        with get_cursor() as cur:
+            order = load_order(cur, order_number, owner_id)
+
+            if not order:
+                flash('Чек не найден', 'error')
+                return redirect(url_for('shop.cart_route'))
+
+            # Заказ после оформления не меняется - чек можно кешировать;
+            # если у браузера актуальная копия, позиции не загружаются
+            etag = receipt_etag(order)
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                filename = f"receipt_{order['order_number']}.txt"
+                response = Response(
+                    iter_receipt(order, load_items(cur, order['id'])),
+                    mimetype='text/plain; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+                )
+
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.max_age = 3600
+        return response
 
     except Exception:
         flash('Ошибка при скачивании чека', 'error')
@@ -283,12 +396,13 @@ def api_get_cart():
                     p.name,
                     p.price,
                     p.stock,
-                    pi.image_url,
-                    (SELECT name FROM categories WHERE id = p.category_id) as category_name,
-                    (SELECT name FROM shop_brand WHERE id = p.brand_id) as brand_name
+                    p.main_image_url as image_url,
+                    c.name as category_name,
+                    b.name as brand_name
                 FROM cart_items ci
                 JOIN products p ON ci.product_id = p.id
-                LEFT JOIN product_images pi ON p.id = pi.product_id AND pi.is_main = TRUE
+                LEFT JOIN categories c ON p.category_id = c.id
+                LEFT JOIN shop_brand b ON p.brand_id = b.id
                 WHERE ci.user_id = %s
             """, (current_user.id,))
 
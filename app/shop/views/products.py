@@ -1,7 +1,72 @@
-from flask import render_template, request, abort, flash
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from flask import render_template, request, abort, flash, jsonify, url_for, current_app
 from flask_login import current_user
 from app.forms import ReviewForm
+from app.autocomplete import suggest_index, ensure_loaded
 from app.database import get_cursor
+from app.facets import get_facets
+from app.pagination import paginate
+from app.reference_cache import reference_cache
+from app.search import product_search, suggest_term
+from app.view_counter import count_view
+
+PER_PAGE = 12
+REVIEWS_PER_PAGE = 20
+API_MAX_LIMIT = 48
+
+
+# Столбцы карточки товара и /api/products. Не p.*: search_vector и полное
+# описание в списке не нужны, а под COUNT(*) OVER () они держатся в памяти
+# для всего результата, а не только для страницы.
+LISTING_COLUMNS = """
+    p.id, p.name, p.price, p.stock, p.is_published, p.created_at,
+    p.category_id, p.brand_id, left(p.description, 100) as description
+"""
+
+CATALOG_SQL = """
+    SELECT {columns},
+        c.name as category_name,
+        b.name as brand_name,
+        COALESCE(p.main_image_url, '/static/images/no-image.png') as image_url,
+        {rank} as search_rank
+    FROM products p
+    LEFT JOIN categories c ON p.category_id = c.id
+    LEFT JOIN shop_brand b ON p.brand_id = b.id
+    WHERE p.is_published = true
+"""
+
+
+def _catalog_query(selected_categories, selected_brands, search=None):
+    """SQL каталога с фильтрами и параметры к нему"""
+    conditions = []
+    params = []
+    rank = '0'
+
+    if search:
+        rank = search.rank
+        params.extend(search.rank_params)
+        conditions.append(search.condition)
+        params.extend(search.params)
+
+    if selected_categories:
+        placeholders = ', '.join(['%s'] * len(selected_categories))
+        conditions.append(f"p.category_id IN ({placeholders})")
+        params.extend(selected_categories)
+
+    if selected_brands:
+        placeholders = ', '.join(['%s'] * len(selected_brands))
+        conditions.append(f"p.brand_id IN ({placeholders})")
+        params.extend(selected_brands)
+
+    sql = CATALOG_SQL.format(columns=LISTING_COLUMNS, rank=rank)
+    if conditions:
+        sql += " AND " + " AND ".join(conditions)
+
+    return sql, params
 
 
 def index():
@@ -12,179 +77,278 @@ def index():
             selected_brands = request.args.getlist('brands', type=int)
             search_query = request.args.get('q', '').strip()
 
-            sql = """
-                SELECT p.*,
-                    c.name as category_name,
-                    b.name as brand_name,
-                    COALESCE(
-                        (SELECT image_url FROM product_images
-                         WHERE product_id = p.id AND is_main = TRUE LIMIT 1),
-                        (SELECT image_url FROM product_images
-                         WHERE product_id = p.id LIMIT 1),
-                        '/static/images/no-image.png'
-                    ) as image_url
-                FROM products p
-                LEFT JOIN categories c ON p.category_id = c.id
-                LEFT JOIN shop_brand b ON p.brand_id = b.id
-                WHERE p.is_published = true
-            """
+            search = product_search(cur, search_query) if search_query else None
+            sql, params = _catalog_query(selected_categories, selected_brands, search)
 
-            conditions = []
-            params = []
+            page = request.args.get('page', 1, type=int)
+            pagination = paginate(cur, sql, params, page, PER_PAGE,
+                                  order_by="q.search_rank DESC, q.created_at DESC, q.id DESC")
 
-            if search_query:
-                conditions.append("(p.name ILIKE %s OR p.description ILIKE %s OR p.sku ILIKE %s)")
-                search_pattern = f'%{search_query}%'
-                params.extend([search_pattern, search_pattern, search_pattern])
+            suggestion = None
+            if search_query and pagination.total == 0:
+                suggestion = suggest_term(cur, search_query)
 
-            if selected_categories:
-                placeholders = ', '.join(['%s'] * len(selected_categories))
-                conditions.append(f"p.category_id IN ({placeholders})")
-                params.extend(selected_categories)
+            categories = reference_cache.categories(cur, published_only=True)
+            brands = reference_cache.brands(cur, published_only=True)
 
-            if selected_brands:
-                placeholders = ', '.join(['%s'] * len(selected_brands))
-                conditions.append(f"p.brand_id IN ({placeholders})")
-                params.extend(selected_brands)
+            facets = get_facets(cur, selected_categories, selected_brands, search_query, search)
 
-            if conditions:
-                sql += " AND " + " AND ".join(conditions)
+            return render_template('shop/index.html',
+                                   products=pagination,
+                                   categories=categories,
+                                   brands=brands,
+                                   facets=facets,
+                                   selected_categories=selected_categories,
+                                   selected_brands=selected_brands,
+                                   search_query=search_query,
+                                   suggestion=suggestion)
+    except Exception:
+        flash('Ошибка при загрузке товаров', 'error')
+        return render_template('shop/index.html', products=[], categories=[], brands=[])
 
-            sql += " ORDER BY p.created_at DESC"
 
-            cur.execute(sql, params)
-            all_products = cur.fetchall()
+def _encode_cursor(created_at, product_id):
+    """Непрозрачный курсор для позиции (created_at, id)"""
+    raw = json.dumps([created_at.isoformat(), product_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
 
-            cur.execute("SELECT * FROM categories WHERE is_published = true ORDER BY name")
-            categories = cur.fetchall()
 
-            cur.execute("SELECT * FROM shop_brand WHERE is_published = true ORDER BY name")
-            brands = cur.fetchall()
+def _decode_cursor(cursor):
+    """Разобрать курсор; ValueError при неверном формате"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, product_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(product_id)
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError('Неверный курсор') from e
 
-            page = request.args.get('page', 1, type=int)
-            per_page = 12
 
-            total = len(all_products)
-            start = (page - 1) * per_page
-            end = start + per_page
-            paginated_products = all_products[start:end]
+def api_products():
+    """API каталога с пагинацией по курсору (для бесконечной прокрутки)"""
+    try:
+        selected_categories = request.args.getlist('categories', type=int)
+        selected_brands = request.args.getlist('brands', type=int)
+        search_query = request.args.get('q', '').strip()
+        limit = min(max(request.args.get('limit', PER_PAGE, type=int), 1), API_MAX_LIMIT)
+        cursor = request.args.get('cursor')
 
-            class Paginate:
-                def __init__(self, items, page, per_page, total):
-                    self.items = items
-                    self.page = page
-                    self.per_page = per_page
-                    self.total = total
-                    self.pages = (total + per_page - 1) // per_page if per_page > 0 else 1
-                    self.has_next = page < self.pages
-                    self.has_prev = page > 1
+        with get_cursor() as cur:
+            search = product_search(cur, search_query) if search_query else None
+            sql, params = _catalog_query(selected_categories, selected_brands, search)
 
-                @property
-                def prev_num(self):
-                    return self.page - 1 if self.has_prev else None
+            if cursor:
+                try:
+                    after_created_at, after_id = _decode_cursor(cursor)
+                except ValueError:
+                    return jsonify({'success': False, 'message': 'Неверный курсор'}), 400
+                sql += " AND (p.created_at, p.id) < (%s, %s)"
+                params.extend([after_created_at, after_id])
 
-                @property
-                def next_num(self):
-                    return self.page + 1 if self.has_next else None
+            # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+            sql += " ORDER BY p.created_at DESC, p.id DESC LIMIT %s"
+            params.append(limit + 1)
 
-            pagination = Paginate(paginated_products, page, per_page, total)
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]['created_at'], rows[-1]['id']) if has_more else None
+
+        items = [{
+            'id': row['id'],
+            'name': row['name'],
+            'price': float(row['price'] or 0),
+            'stock': row['stock'],
+            'image_url': row['image_url'],
+            'category_name': row['category_name'],
+            'brand_name': row['brand_name'],
+            'url': url_for('shop.product_detail_route', product_id=row['id'])
+        } for row in rows]
+
+        return jsonify({
+            'success': True,
+            'items': items,
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        })
 
-            return render_template('shop/index.html',
-                                   products=pagination,
-                                   categories=categories,
-                                   brands=brands,
-                                   selected_categories=selected_categories,
-                                   selected_brands=selected_brands,
-                                   search_query=search_query)
     except Exception:
-        flash('Ошибка при загрузке товаров', 'error')
-        return render_template('shop/index.html', products=[], categories=[], brands=[])
+        return jsonify({'success': False, 'message': 'Ошибка при загрузке товаров'}), 500
+
+
+def api_search_suggest():
+    """API автодополнения поиска (из индекса в памяти, без запроса к БД)"""
+    try:
+        query = request.args.get('q', '').strip()
+        if len(query) < 2:
+            return jsonify({'success': True, 'query': query,
+                            'products': [], 'brands': [], 'categories': []})
+
+        if suggest_index.is_stale(current_app.config.get('AUTOCOMPLETE_REFRESH_SECONDS', 300)):
+            with get_cursor() as cur:
+                ensure_loaded(cur)
+
+        limit = min(max(request.args.get('limit', 5, type=int), 1), 10)
+        found = suggest_index.search(query, limit=limit)
+
+        return jsonify({
+            'success': True,
+            'query': query,
+            'products': [{
+                'id': item['id'],
+                'name': item['name'],
+                'url': url_for('shop.product_detail_route', product_id=item['id'])
+            } for item in found['product']],
+            'brands': [{
+                'id': item['id'],
+                'name': item['name'],
+                'url': url_for('shop.index', brands=item['id'])
+            } for item in found['brand']],
+            'categories': [{
+                'id': item['id'],
+                'name': item['name'],
+                'url': url_for('shop.category_products_route', slug=item['slug'])
+            } for item in found['category']]
+        })
+
+    except Exception:
+        return jsonify({'success': False, 'message': 'Ошибка автодополнения'}), 500
+
+
+PRODUCT_DETAIL_SQL = """
+    SELECT
+        p.*,
+        c.name as category_name,
+        b.name as brand_name,
+        COALESCE(p.main_image_url, '/static/images/no-image.png') as main_image,
+        COALESCE((
+            SELECT json_agg(json_build_object(
+                'image_url', pi.image_url, 'is_main', pi.is_main, 'sort_order', pi.sort_order
+            ) ORDER BY pi.is_main DESC, pi.sort_order)
+            FROM product_images pi
+            WHERE pi.product_id = p.id
+        ), '[]') as images_json,
+        COALESCE((
+            SELECT json_agg(json_build_object(
+                'size', ps.size, 'quantity', ps.quantity
+            ) ORDER BY ps.size)
+            FROM product_sizes ps
+            WHERE ps.product_id = p.id
+        ), '[]') as sizes_json,
+        COALESCE((
+            SELECT json_agg(json_build_object(
+                'attribute_type', pa.attribute_type, 'value', pa.value
+            ))
+            FROM product_attributes pa
+            WHERE pa.product_id = p.id
+        ), '[]') as attributes_json,
+        COALESCE((
+            SELECT json_agg(rv.review ORDER BY rv.created_at DESC, rv.id DESC)
+            FROM (
+                SELECT
+                    to_jsonb(r) || jsonb_build_object(
+                        'author_name', COALESCE(u.username, 'Анонимный пользователь')
+                    ) as review,
+                    r.created_at,
+                    r.id
+                FROM reviews r
+                LEFT JOIN users u ON r.user_id = u.id
+                WHERE r.product_id = p.id
+                ORDER BY r.created_at DESC, r.id DESC
+                LIMIT %(reviews_limit)s
+            ) rv
+        ), '[]') as reviews_json,
+        (SELECT COUNT(*) FROM reviews WHERE product_id = p.id) as reviews_total
+    FROM products p
+    LEFT JOIN categories c ON p.category_id = c.id
+    LEFT JOIN shop_brand b ON p.brand_id = b.id
+    WHERE p.id = %(id)s
+"""
+
+
+# Следующие страницы отзывов: курсор по (created_at, id), как в api_products
+REVIEWS_PAGE_SQL = """
+    SELECT r.*, COALESCE(u.username, 'Анонимный пользователь') as author_name
+    FROM reviews r
+    LEFT JOIN users u ON r.user_id = u.id
+    WHERE r.product_id = %(id)s
+      AND (r.created_at, r.id) < (%(after_created_at)s, %(after_id)s)
+    ORDER BY r.created_at DESC, r.id DESC
+    LIMIT %(limit)s
+"""
+
+
+def _parse_timestamps(row, fields=('created_at', 'updated_at')):
+    """Вернуть даты из JSON (строки ISO) обратно в datetime"""
+    for field in fields:
+        value = row.get(field)
+        if isinstance(value, str):
+            row[field] = datetime.fromisoformat(value)
+    return row
+
+
+def _load_product_detail(cur, product_id):
+    """Товар вместе с фото, размерами, атрибутами и первой страницей отзывов.
+
+    Всё загружается одним запросом.
+    """
+    cur.execute(PRODUCT_DETAIL_SQL, {'id': product_id, 'reviews_limit': REVIEWS_PER_PAGE})
+    row = cur.fetchone()
+    if not row:
+        return None
+
+    product = dict(row)
+    images = product.pop('images_json')
+    sizes = product.pop('sizes_json')
+    attributes = product.pop('attributes_json')
+    reviews = [_parse_timestamps(review) for review in product.pop('reviews_json')]
+
+    return product, images, sizes, attributes, reviews
+
+
+def _reviews_next_cursor(reviews, has_more):
+    """Курсор следующей страницы отзывов или None"""
+    if not has_more or not reviews:
+        return None
+    return _encode_cursor(reviews[-1]['created_at'], reviews[-1]['id'])
+
+
+def _product_visible(product):
+    """Неопубликованный товар видят только продавец и администраторы"""
+    if product.get('is_published'):
+        return True
+    if not current_user.is_authenticated:
+        return False
+    seller_id = product.get('seller_id')
+    return not seller_id or current_user.id == seller_id or current_user.is_staff
 
 
 def product_detail(product_id):
     """Страница товара"""
     try:
         with get_cursor() as cur:
-            sql = """
-                SELECT
-                    p.*,
-                    c.name as category_name,
-                    b.name as brand_name,
-                    COALESCE(
-                        (SELECT image_url FROM product_images
-                         WHERE product_id = p.id AND is_main = TRUE LIMIT 1),
-                        (SELECT image_url FROM product_images
-                         WHERE product_id = p.id LIMIT 1),
-                        '/static/images/no-image.png'
-                    ) as main_image
-                FROM products p
-                LEFT JOIN categories c ON p.category_id = c.id
-                LEFT JOIN shop_brand b ON p.brand_id = b.id
-                WHERE p.id = %s
-            """
-            cur.execute(sql, (product_id,))
-            product = cur.fetchone()
+            loaded = _load_product_detail(cur, product_id)
 
-            if not product:
+            if not loaded:
                 abort(404)
 
-            is_published = product.get('is_published')
-            seller_id = product.get('seller_id')
-
-            if not is_published:
-                if not current_user.is_authenticated:
-                    abort(404)
-                if seller_id and current_user.id != seller_id and not current_user.is_staff:
-                    abort(404)
+            product, images, sizes, attributes, reviews = loaded
 
-            cur.execute("""
-                SELECT
-                    r.*,
-                    COALESCE(u.username, 'Анонимный пользователь') as author_name
-                FROM reviews r
-                LEFT JOIN users u ON r.user_id = u.id
-                WHERE r.product_id = %s
-                ORDER BY r.created_at DESC
-            """, (product_id,))
-            reviews = cur.fetchall()
+            if not _product_visible(product):
+                abort(404)
 
-            try:
-                cur.execute("""
-                    UPDATE products
-                    SET views = COALESCE(views, 0) + 1
-                    WHERE id = %s
-                """, (product_id,))
-            except Exception:
-                pass
-
-            cur.execute("""
-                SELECT image_url, is_main, sort_order
-                FROM product_images
-                WHERE product_id = %s
-                ORDER BY is_main DESC, sort_order
-            """, (product_id,))
-            images = cur.fetchall()
-
-            cur.execute("""
-                SELECT size, quantity
-                FROM product_sizes
-                WHERE product_id = %s
-                ORDER BY size
-            """, (product_id,))
-            sizes = cur.fetchall()
-
-            cur.execute("""
-                SELECT attribute_type, value
-                FROM product_attributes
-                WHERE product_id = %s
-            """, (product_id,))
-            attributes = cur.fetchall()
+            count_view(product_id)
 
             form = ReviewForm()
 
             return render_template('shop/detail.html',
                                    product=product,
                                    reviews=reviews,
+                                   reviews_total=product['reviews_total'],
+                                   reviews_next_cursor=_reviews_next_cursor(
+                                       reviews, product['reviews_total'] > len(reviews)
+                                   ),
                                    images=images,
                                    sizes=sizes,
                                    attributes=attributes,
@@ -194,17 +358,54 @@ def product_detail(product_id):
         abort(500, description="Ошибка при загрузке товара")
 
 
+def product_reviews(product_id):
+    """API следующей страницы отзывов (кнопка "Показать ещё отзывы")"""
+    try:
+        cursor = request.args.get('cursor', '')
+        try:
+            after_created_at, after_id = _decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Неверный курсор'}), 400
+
+        with get_cursor() as cur:
+            cur.execute("SELECT id, is_published, seller_id FROM products WHERE id = %s",
+                        (product_id,))
+            product = cur.fetchone()
+            if not product or not _product_visible(product):
+                return jsonify({'success': False, 'message': 'Товар не найден'}), 404
+
+            # На одну строку больше - чтобы узнать, есть ли следующая страница
+            cur.execute(REVIEWS_PAGE_SQL, {
+                'id': product_id,
+                'after_created_at': after_created_at,
+                'after_id': after_id,
+                'limit': REVIEWS_PER_PAGE + 1
+            })
+            reviews = cur.fetchall()
+
+        has_more = len(reviews) > REVIEWS_PER_PAGE
+        reviews = reviews[:REVIEWS_PER_PAGE]
+
+        html = ''.join(
+            render_template('includes/review_card.html', review=review, product=product)
+            for review in reviews
+        )
+
+        return jsonify({
+            'success': True,
+            'html': html,
+            'next_cursor': _reviews_next_cursor(reviews, has_more)
+        })
+
+    except Exception:
+        return jsonify({'success': False, 'message': 'Ошибка при загрузке отзывов'}), 500
+
+
 def categories_list():
     """Список категорий"""
     try:
         with get_cursor() as cur:
-            cur.execute("""
-                SELECT *
-                FROM categories
-                WHERE is_published = true
-                ORDER BY name
-            """)
-            categories = cur.fetchall()
+            categories = reference_cache.categories(cur, published_only=True)
 
             return render_template('shop/categories.html', categories=categories)
 
@@ -217,65 +418,27 @@ def category_products(slug):
     """Товары категории"""
     try:
         with get_cursor() as cur:
-            cur.execute("""
-                SELECT *
-                FROM categories
-                WHERE slug = %s AND is_published = true
-            """, (slug,))
-            category = cur.fetchone()
-
-            if not category:
+            category = reference_cache.category(cur, slug=slug)
+
+            if not category or not category.get('is_published'):
                 abort(404)
 
             category_id = category.get('id')
 
-            sql = """
-                SELECT
-                    p.*,
+            sql = f"""
+                SELECT {LISTING_COLUMNS},
                     c.name as category_name,
                     b.name as brand_name,
-                    COALESCE(
-                        (SELECT image_url FROM product_images
-                         WHERE product_id = p.id AND is_main = TRUE LIMIT 1),
-                        '/static/images/no-image.png'
-                    ) as image_url
+                    COALESCE(p.main_image_url, '/static/images/no-image.png') as image_url
                 FROM products p
                 LEFT JOIN categories c ON p.category_id = c.id
                 LEFT JOIN shop_brand b ON p.brand_id = b.id
                 WHERE p.category_id = %s AND p.is_published = true
-                ORDER BY p.created_at DESC
             """
 
-            cur.execute(sql, (category_id,))
-            products = cur.fetchall()
-
             page = request.args.get('page', 1, type=int)
-            per_page = 12
-
-            total = len(products)
-            start = (page - 1) * per_page
-            end = start + per_page
-            paginated_products = products[start:end]
-
-            class Paginate:
-                def __init__(self, items, page, per_page, total):
-                    self.items = items
-                    self.page = page
-                    self.per_page = per_page
-                    self.total = total
-                    self.pages = (total + per_page - 1) // per_page if per_page > 0 else 1
-                    self.has_next = page < self.pages
-                    self.has_prev = page > 1
-
-                @property
-                def prev_num(self):
-                    return self.page - 1 if self.has_prev else None
-
-                @property
-                def next_num(self):
-                    return self.page + 1 if self.has_next else None
-
-            pagination = Paginate(paginated_products, page, per_page, total)
+            pagination = paginate(cur, sql, [category_id], page, PER_PAGE,
+                                  order_by="q.created_at DESC, q.id DESC")
 
             return render_template('shop/category.html',
                                    category=category,
@@ -289,13 +452,7 @@ def brands_list():
     """Список брендов"""
     try:
         with get_cursor() as cur:
-            cur.execute("""
-                SELECT *
-                FROM shop_brands
-                WHERE is_published = true
-                ORDER BY name
-            """)
-            brands = cur.fetchall()
+            brands = reference_cache.brands(cur, published_only=True)
 
             return render_template('shop/brands.html', brands=brands)
 
@@ -0,0 +1,65 @@
+"""
+Проверка наличия товаров на складе
+"""
+
+
+def _key(product_id, size):
+    return int(product_id), (str(size) if size else None)
+
+
+def check_stock_batch(cur, lines):
+    """Проверить наличие для всех строк корзины одним запросом.
+
+    lines - последовательность (product_id, size, quantity). Возвращает
+    словарь {(product_id, size): (available, message)}; одинаковые пары
+    товар/размер суммируются.
+    """
+    requested = {}
+    for product_id, size, quantity in lines:
+        key = _key(product_id, size)
+        requested[key] = requested.get(key, 0) + int(quantity)
+
+    if not requested:
+        return {}
+
+    product_ids = [key[0] for key in requested]
+    sizes = [key[1] for key in requested]
+
+    cur.execute("""
+        SELECT r.product_id, r.size,
+               p.stock, p.is_published,
+               ps.quantity as size_stock,
+               (ps.product_id IS NOT NULL) as size_exists
+        FROM unnest(%s::int[], %s::text[]) AS r(product_id, size)
+        LEFT JOIN products p ON p.id = r.product_id
+        LEFT JOIN product_sizes ps
+            ON ps.product_id = r.product_id AND ps.size::text = r.size
+    """, (product_ids, sizes))
+
+    results = {}
+    for row in cur.fetchall():
+        key = (row['product_id'], row['size'])
+        quantity = requested[key]
+        size = row['size']
+
+        if row['stock'] is None or not row['is_published']:
+            # Снятый с публикации товар недоступен и с размером, как в add_to_cart
+            results[key] = (False, "Товар не найден")
+        elif size:
+            if not row['size_exists']:
+                results[key] = (False, "Размер недоступен")
+            elif quantity > (row['size_stock'] or 0):
+                results[key] = (False, f"Для размера {size} доступно только {row['size_stock'] or 0} шт.")
+            else:
+                results[key] = (True, None)
+        elif quantity > row['stock']:
+            results[key] = (False, f"Доступно только {row['stock']} шт.")
+        else:
+            results[key] = (True, None)
+
+    return results
+
+
+def stock_status(results, product_id, size):
+    """Результат проверки для одной строки: (available, message)"""
+    return results.get(_key(product_id, size), (False, "Ошибка проверки наличия"))
@@ -7,6 +7,8 @@ import secrets
 from app.forms import RegistrationForm, LoginForm
 from app.database import get_cursor
 from app.models import User
+from app.outbox import outbox_worker
+from app.utils.email_sender import queue_verification_email
 
 
 def register_view():
@@ -51,32 +53,19 @@ def register_view():
 
         result = cur.fetchone()
         if result:
-            user_id = result['id']
-
-            try:
-                from app.utils.email_sender import send_verification_email
-                app = current_app._get_current_object()
-
-                success = send_verification_email(
-                    app,
-                    form.email.data,
-                    form.username.data,
-                    verification_token
-                )
-
-                if success:
-                    flash('Регистрация прошла успешно! Проверьте ваш email для подтверждения.', 'success')
-                else:
-                    flash('Регистрация прошла успешно, но не удалось отправить email для подтверждения.', 'warning')
-                    flash('Свяжитесь с администратором для активации аккаунта.', 'warning')
-
-            except Exception as e:
-                current_app.logger.error(f'Ошибка отправки email: {e}')
-                flash('Регистрация прошла успешно, но не удалось отправить email для подтверждения.', 'warning')
-                flash('Свяжитесь с администратором для активации аккаунта.', 'warning')
+            # Письмо попадает в очередь в той же транзакции, что и пользователь
+            queue_verification_email(
+                cur,
+                current_app._get_current_object(),
+                form.username.data,
+                form.email.data,
+                verification_token
+            )
 
             g.db.commit()
+            outbox_worker.wake()
             cur.close()
+            flash('Регистрация прошла успешно! Проверьте ваш email для подтверждения.', 'success')
             return redirect(url_for('users.login'))
 
     return render_template('users/register.html', form=form)
@@ -167,35 +156,19 @@ def resend_verification_view():
             WHERE email = %s
         """, (new_token, email))
 
+        queue_verification_email(
+            cur,
+            current_app._get_current_object(),
+            user_data['username'],
+            email,
+            new_token
+        )
+
         g.db.commit()
+        outbox_worker.wake()
         cur.close()
 
-        user_id = user_data['id']
-        username = user_data['username']
-
-        try:
-            from app.utils.email_sender import send_verification_email
-            app = current_app._get_current_object()
-
-            success = send_verification_email(
-                app=app,
-                user_id=user_id,
-                username=username,
-                email=email,
-                token=new_token
-            )
-
-            if success:
-                flash('Новая ссылка для подтверждения отправлена на ваш email!', 'success')
-            else:
-                flash('Ссылка обновлена, но не удалось отправить email', 'warning')
-
-        except ImportError:
-            flash('Модуль отправки email не найден', 'danger')
-        except Exception as e:
-            current_app.logger.error(f'Ошибка отправки email: {e}')
-            flash('Ссылка обновлена, но возникла ошибка при отправке email', 'warning')
-
+        flash('Новая ссылка для подтверждения отправлена на ваш email!', 'success')
         return redirect(url_for('users.login'))
 
     return render_template('users/resend_verification.html')
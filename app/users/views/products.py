@@ -10,9 +10,7 @@ def my_products_view():
 
     cur.execute("""
         SELECT p.*, c.name as category_name, b.name as brand_name,
-            (SELECT image_url FROM product_images
-                WHERE product_id = p.id AND is_main = TRUE LIMIT 1
-                ) as main_image
+            p.main_image_url as main_image
         FROM products p
         LEFT JOIN categories c ON p.category_id = c.id
         LEFT JOIN shop_brand b ON p.brand_id = b.id
@@ -90,8 +90,9 @@ def profile_view(username):
                     flash('Неподдерживаемый формат файла. Разрешены: PNG, JPG, JPEG, GIF', 'danger')
 
     cur.execute("""
-        SELECT p.*, c.name AS category_name, b.name AS brand_name,
-            (SELECT image_url FROM product_images WHERE product_id = p.id AND is_main = TRUE LIMIT 1) as main_image
+        SELECT p.id, p.name, p.price, p.is_published, p.created_at,
+            c.name AS category_name, b.name AS brand_name,
+            p.main_image_url as main_image
         FROM products p
         LEFT JOIN categories c ON p.category_id = c.id
         LEFT JOIN shop_brand b ON p.brand_id = b.id
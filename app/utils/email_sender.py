@@ -5,6 +5,8 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from flask import render_template, current_app
 
+from app.outbox import enqueue
+
 
 def generate_verification_token(length=32):
     """Генерация токена для подтверждения email"""
@@ -56,6 +58,52 @@ def send_email(app, to_email, subject, html_content):
         return False
 
 
+def build_verification_email(app, username, token):
+    """Тема и HTML письма для подтверждения регистрации"""
+    base_url = app.config.get('BASE_URL', 'http://localhost:5000')
+    confirm_url = f"{base_url}/users/verify-email/{token}"
+
+    subject = f"Подтверждение регистрации в {app.config.get('APP_NAME', 'Shoe Shop')}"
+
+    html_content = f"""
+    <!DOCTYPE html>
+    <html>
+    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
+        <div style="background-color: #007bff; color: white; padding: 20px; text-align: center; border-radius: 5px 5px 0 0;">
+            <h1>Добро пожаловать, {username}!</h1>
+        </div>
+
+        <div style="padding: 30px; background-color: #f8f9fa; border-radius: 0 0 5px 5px;">
+            <p>Спасибо за регистрацию в <strong>Shoe Shop</strong>!</p>
+
+            <p>Для завершения регистрации и активации вашего аккаунта, пожалуйста, подтвердите ваш email адрес, нажав на кнопку ниже:</p>
+    
+            <div style="text-align: center;">
+                <a href="{confirm_url}" style="background-color: #28a745; color: white; padding: 12px 24px; text-decoration: none; border-radius: 4px; display: inline-block;">
+                    Подтвердить Email
+                </a>
+            </div>
+
+            <p>Если кнопка не работает, скопируйте и вставьте ссылку в браузер:</p>
+            <p style="word-break: break-all;">
+                <a href="{confirm_url}">{confirm_url}</a>
+            </p>
+
+            <p><strong>Важно:</strong> Без подтверждения email вы не сможете войти в свой аккаунт.</p>
+        </div>
+    </body>
+    </html>
+    """
+
+    return subject, html_content, confirm_url
+
+
+def queue_verification_email(cur, app, username, email, token):
+    """Поставить письмо подтверждения в очередь (в текущей транзакции)"""
+    subject, html_content, _ = build_verification_email(app, username, token)
+    return enqueue(cur, email, subject, html=html_content, kind='verification')
+
+
 def send_verification_email(app, user_id, username, email, token):
     """Отправка email для подтверждения регистрации - ИСПРАВЛЕННАЯ ВЕРСИЯ"""
     try:
@@ -65,44 +113,11 @@ def send_verification_email(app, user_id, username, email, token):
         print(f"   Имя: {username}")
         print(f"   Токен: {token}")
 
-        base_url = app.config.get('BASE_URL', 'http://localhost:5000')
-        confirm_url = f"{base_url}/users/verify-email/{token}"
-
-        subject = f"Подтверждение регистрации в {app.config.get('APP_NAME', 'Shoe Shop')}"
+        subject, html_content, confirm_url = build_verification_email(app, username, token)
 
         print(f"\n Ссылка для подтверждения: {confirm_url}")
         print(f" Тема письма: {subject}")
 
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
-            <div style="background-color: #007bff; color: white; padding: 20px; text-align: center; border-radius: 5px 5px 0 0;">
-                <h1>Добро пожаловать, {username}!</h1>
-            </div>
-
-            <div style="padding: 30px; background-color: #f8f9fa; border-radius: 0 0 5px 5px;">
-                <p>Спасибо за регистрацию в <strong>Shoe Shop</strong>!</p>
-
-                <p>Для завершения регистрации и активации вашего аккаунта, пожалуйста, подтвердите ваш email адрес, нажав на кнопку ниже:</p>
-    
-                <div style="text-align: center;">
-                    <a href="{confirm_url}" style="background-color: #28a745; color: white; padding: 12px 24px; text-decoration: none; border-radius: 4px; display: inline-block;">
-                        Подтвердить Email
-                    </a>
-                </div>
-
-                <p>Если кнопка не работает, скопируйте и вставьте ссылку в браузер:</p>
-                <p style="word-break: break-all;">
-                    <a href="{confirm_url}">{confirm_url}</a>
-                </p>
-
-                <p><strong>Важно:</strong> Без подтверждения email вы не сможете войти в свой аккаунт.</p>
-            </div>
-        </body>
-        </html>
-        """
-
         smtp_server = app.config.get('MAIL_SERVER', '')
         smtp_port = app.config.get('MAIL_PORT', 587)
         smtp_username = app.config.get('MAIL_USERNAME', '')
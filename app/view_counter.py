@@ -0,0 +1,164 @@
+"""
+Счётчик просмотров товаров с буферизацией в памяти процесса.
+
+Просмотры суммируются по id товара и раз в VIEW_COUNTER_FLUSH_SECONDS
+записываются одним UPDATE ... FROM (VALUES ...), а также при остановке
+процесса. Популярный товар больше не блокирует строку на каждый GET.
+"""
+import atexit
+import logging
+import os
+import re
+import threading
+from collections import Counter
+
+from flask import request, session
+from psycopg2.extras import execute_values
+
+from app.database import get_pool
+
+logger = logging.getLogger(__name__)
+
+BOT_RE = re.compile(r'bot|crawl|spider|slurp|preview|facebookexternalhit|headless', re.IGNORECASE)
+
+# Сколько последних просмотренных товаров помнить в сессии
+SESSION_VIEWED_LIMIT = 50
+
+
+class ViewCounter:
+    """Буфер приращений просмотров с фоновой записью в БД"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.app = None
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['view_counter'] = self
+        atexit.register(self.shutdown)
+
+    def record(self, product_id, n=1):
+        """Учесть просмотр (без обращения к БД)"""
+        with self._lock:
+            self._counts[product_id] += n
+        self._ensure_worker()
+
+    def pending(self):
+        with self._lock:
+            return sum(self._counts.values())
+
+    def _drain(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        return counts
+
+    def _restore(self, counts):
+        with self._lock:
+            self._counts.update(counts)
+
+    def flush(self):
+        """Записать накопленные просмотры. Возвращает число обновлённых товаров."""
+        counts = self._drain()
+        if not counts or self.app is None:
+            return 0
+
+        # Единый порядок id - одинаковый порядок блокировок во всех процессах
+        rows = sorted(counts.items())
+        pool = conn = None
+        written = False
+        try:
+            pool = get_pool(self.app)
+            conn = pool.getconn()
+            with conn.cursor() as cur:
+                execute_values(cur, """
+                    UPDATE products p
+                    SET views = COALESCE(p.views, 0) + v.n
+                    FROM (VALUES %s) AS v(id, n)
+                    WHERE p.id = v.id
+                """, rows, page_size=len(rows))
+            conn.commit()
+            written = True
+            return len(rows)
+
+        except Exception as e:
+            logger.warning('Не удалось записать просмотры товаров: %s', e)
+            if conn is not None:
+                try:
+                    conn.rollback()
+                except Exception:
+                    # Соединение разорвано - пул заменит его при возврате
+                    pass
+            return 0
+
+        finally:
+            if not written:
+                # Не теряем просмотры: вернём их в буфер до следующей попытки
+                self._restore(counts)
+            if conn is not None:
+                pool.putconn(conn)
+
+    def _ensure_worker(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='view-counter', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        interval = self.app.config.get('VIEW_COUNTER_FLUSH_SECONDS', 30) if self.app else 30
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except Exception:
+                # Поток должен пережить любую ошибку, иначе просмотры копятся в памяти
+                logger.exception('Ошибка фоновой записи просмотров товаров')
+
+    def shutdown(self):
+        """Остановить фоновую запись и сбросить остаток буфера"""
+        self._stop.set()
+        if self._pid == os.getpid():
+            self.flush()
+
+    def _reset_after_fork(self):
+        # Буфер родителя запишет сам родитель; поток в дочернем процессе не существует
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+
+view_counter = ViewCounter()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=view_counter._reset_after_fork)
+
+
+def count_view(product_id):
+    """Учесть просмотр страницы товара текущим посетителем.
+
+    Боты и повторные просмотры в пределах сессии не считаются
+    (настройки VIEW_COUNTER_SKIP_BOTS и VIEW_COUNTER_UNIQUE_PER_SESSION).
+    """
+    config = view_counter.app.config if view_counter.app else {}
+
+    if config.get('VIEW_COUNTER_SKIP_BOTS', True):
+        if BOT_RE.search(request.headers.get('User-Agent', '')):
+            return False
+
+    if config.get('VIEW_COUNTER_UNIQUE_PER_SESSION', True):
+        viewed = session.get('viewed_products', [])
+        if product_id in viewed:
+            return False
+        session['viewed_products'] = (viewed + [product_id])[-SESSION_VIEWED_LIMIT:]
+
+    view_counter.record(product_id)
+    return True
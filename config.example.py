@@ -21,6 +21,22 @@ class Config:
     DB_USER = os.getenv('DB_USER', 'postgres')
     DB_PASSWORD = os.getenv('DB_PASSWORD', 'your-db-password')
 
+    # Пул соединений
+    DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+    DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))  # ожидание свободного соединения, с
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'True') == 'True'
+    DB_POOL_PING_INTERVAL = float(os.getenv('DB_POOL_PING_INTERVAL', '10'))  # проверять простаивавшие дольше, с
+
+    # Нечёткий поиск: порог word_similarity для оператора <% (по умолчанию
+    # в pg_trgm 0.6 - слишком строго для опечаток вроде "Adiddas")
+    SEARCH_WORD_SIMILARITY_THRESHOLD = 0.45
+
+    # Учёт SQL-запросов
+    SQL_SLOW_QUERY_MS = int(os.getenv('SQL_SLOW_QUERY_MS', '200'))  # порог медленного запроса
+    SQL_REPEAT_THRESHOLD = int(os.getenv('SQL_REPEAT_THRESHOLD', '5'))  # предупреждение о N+1
+    SQL_DEBUG_HEADERS = DEBUG  # заголовки X-DB-Query-Count и X-DB-Time-ms
+
     # Файлы
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     UPLOAD_FOLDER = str(BASE_DIR / 'static' / 'uploads')
@@ -30,6 +46,31 @@ class Config:
     EMAIL_BACKEND = 'file'
     EMAIL_FILE_PATH = BASE_DIR / 'media' / 'sent_emails'
 
+    # Автодополнение поиска: полная перестройка индекса не реже, чем раз в N секунд
+    AUTOCOMPLETE_REFRESH_SECONDS = 300
+
+    # Время жизни кеша фасетных счётчиков каталога, с
+    FACET_CACHE_SECONDS = 60
+
+    # Кеш справочников (категории, бренды): перечитывание не реже, чем раз в N секунд
+    REFERENCE_CACHE_SECONDS = 300
+
+    # Кеш количества товаров в корзине (бейдж в шапке), с
+    CART_COUNT_CACHE_SECONDS = 300
+
+    # Список файлов изображений товаров: перечитывание не реже, чем раз в N секунд
+    MEDIA_MANIFEST_REFRESH_SECONDS = 300
+
+    # Idempotency-Key для /api/checkout: срок хранения ответа и ожидание
+    # параллельного запроса с тем же ключом
+    IDEMPOTENCY_KEY_TTL_HOURS = 24
+    IDEMPOTENCY_LOCK_TIMEOUT = '30s'
+
+    # Счётчик просмотров: запись накопленных просмотров в БД раз в N секунд
+    VIEW_COUNTER_FLUSH_SECONDS = 30
+    VIEW_COUNTER_SKIP_BOTS = True
+    VIEW_COUNTER_UNIQUE_PER_SESSION = True
+
     # Пагинация
     POSTS_PER_PAGE = 10
     POSTS_ON_HOME_PAGE = 5
@@ -50,10 +91,27 @@ class Config:
     MAIL_PASSWORD = 'your-email-password' # ваш пароль от mail.ru
     MAIL_DEFAULT_SENDER = 'your-email@mail.ru'
 
+    # Очередь писем: фоновые потоки доставки и повторные попытки.
+    # Для локальной проверки: python -m aiosmtpd -n -l localhost:1025 и
+    # MAIL_SERVER = 'localhost', MAIL_PORT = 1025, MAIL_USE_TLS = False, MAIL_USERNAME = None
+    OUTBOX_AUTOSTART = True          # с первого запроса; False - письма отправляет только `flask outbox-worker`
+    OUTBOX_WORKERS = 2
+    OUTBOX_POLL_SECONDS = 5
+    OUTBOX_BATCH_SIZE = 20
+    OUTBOX_MAX_ATTEMPTS = 8
+    OUTBOX_RETRY_BASE_SECONDS = 30
+    OUTBOX_RETRY_MAX_SECONDS = 3600
+
+    # Массовая рассылка (flask send-bulk-mail)
+    BULK_MAIL_RATE = 10              # писем в секунду на все соединения (0 - без ограничения)
+    BULK_MAIL_CONNECTIONS = 3        # постоянных SMTP-соединений
+    BULK_MAIL_BATCH_SIZE = 500       # получателей между сохранениями прогресса
+
     # Папка для чеков
     RECEIPTS_FOLDER = os.path.join(os.path.dirname(__file__), 'receipts')
 
     EXPORT_DIR = 'exports'
+    EXPORT_ITERSIZE = 2000           # строк за одно чтение серверного курсора при экспорте
     IMPORT_DIR = 'imports'
 
     # Максимальный размер загружаемых файлов (16MB)
@@ -4,6 +4,7 @@
 """
 
 import os
+import click
 from app import create_app
 from app.extensions import db
 from app.models import User, Category, Brand, Product, Review
@@ -229,6 +230,90 @@ def init_db():
     print("4. Покупатель 1 - login: buyer1, password: password123")
     print("5. Покупатель 2 - login: buyer2, password: password123")
 
+@app.cli.command("upgrade-db")
+def upgrade_db():
+    """
+    Применение изменений схемы (индексы, служебные таблицы)
+    Команда: flask upgrade-db
+    """
+    from app.schema import apply_migrations
+
+    applied = apply_migrations()
+    if applied:
+        for name in applied:
+            print(f"Применена миграция: {name}")
+    else:
+        print("Схема базы данных актуальна.")
+
+
+@app.cli.command("outbox-worker")
+def outbox_worker_command():
+    """
+    Отдельный процесс доставки писем из очереди (Ctrl+C - остановка)
+    Команда: flask outbox-worker
+    """
+    import time
+    from app.outbox import outbox_worker
+
+    outbox_worker.start()
+    print(f"Доставка писем запущена, потоков: {app.config.get('OUTBOX_WORKERS', 2)}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        outbox_worker.stop()
+
+
+@app.cli.command("send-bulk-mail")
+@click.argument("campaign")
+@click.option("--template", "template_name", required=True, help="Шаблон, например emails/news.html")
+@click.option("--subject", required=True, help="Тема письма (можно использовать {{ first_name }} и т.п.)")
+@click.option("--rate", type=float, default=None, help="Писем в секунду")
+@click.option("--connections", type=int, default=None, help="Число SMTP-соединений")
+@click.option("--all-users", is_flag=True, help="Включая пользователей с неподтверждённым email")
+def send_bulk_mail(campaign, template_name, subject, rate, connections, all_users):
+    """
+    Массовая рассылка пользователям. Повторный запуск с тем же именем
+    продолжает прерванную рассылку.
+    Команда: flask send-bulk-mail news-2024-05 --template emails/news.html --subject "Новинки"
+    """
+    from app.bulk_mail import CampaignMismatch, send_campaign
+
+    def progress(totals):
+        print(f"Отправлено: {totals['sent']}, ошибок: {totals['failed']}")
+
+    try:
+        totals = send_campaign(
+            app, campaign, template_name, subject,
+            verified_only=not all_users, rate=rate,
+            connections=connections, progress=progress,
+        )
+    except CampaignMismatch as e:
+        print(f"Ошибка: {e}")
+        return
+    print(f"Рассылка {campaign} завершена: отправлено {totals['sent']}, "
+          f"ошибок {totals['failed']}")
+
+
+@app.cli.command("purge-idempotency-keys")
+def purge_idempotency_keys():
+    """
+    Удаление просроченных ключей идемпотентности
+    Команда: flask purge-idempotency-keys
+    """
+    from app.database import get_db_connection
+    from app.idempotency import purge_expired
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            deleted = purge_expired(cur)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Удалено ключей: {deleted}")
+
+
 @app.cli.command("reset-db")
 def reset_db():
     """
@@ -0,0 +1,34 @@
+from flask import Flask
+from jinja2 import DictLoader
+
+from app.bulk_mail import CampaignTemplate
+
+
+def make_app(templates):
+    app = Flask(__name__)
+    app.jinja_loader = DictLoader(templates)
+    return app
+
+
+def test_filters_apply_to_recipient_values():
+    app = make_app({
+        'emails/news.html': '<p>{{ first_name|title }}, {{ username|upper }}</p>'
+                            '{% if last_name %}<p>{{ last_name }}</p>{% endif %}',
+    })
+    campaign = CampaignTemplate(app, 'emails/news.html', 'Привет, {{ first_name|title }}!')
+
+    subject, html = campaign.render({'username': 'anna_k', 'first_name': 'anna',
+                                     'last_name': None, 'email': 'anna@example.com'})
+
+    assert subject == 'Привет, Anna!'
+    assert html == '<p>Anna, ANNA_K</p>'
+
+
+def test_personal_fields_are_escaped_in_html_only():
+    app = make_app({'emails/news.html': '<p>{{ first_name }}</p>'})
+    campaign = CampaignTemplate(app, 'emails/news.html', '{{ first_name }}')
+
+    subject, html = campaign.render({'first_name': 'Tom & <Jerry>'})
+
+    assert subject == 'Tom & <Jerry>'
+    assert html == '<p>Tom &amp; &lt;Jerry&gt;</p>'